@@ -43,8 +43,17 @@ class MyToolbar(NavigationToolbar2Tk):
         if initialdir != "":
             mpl.rcParams['savefig.directory'] = (
                 os.path.dirname(str(fname)))
+        # blit用のanimatedなartistはsavefigで描画されないので，保存中だけ解除する
+        animated_artists = self.canvas.figure.findobj(lambda artist: artist.get_animated())
+        for artist in animated_artists:
+            artist.set_animated(False)
         try:
             # This method will handle the delegation to the correct type
             self.canvas.figure.savefig(fname, transparent=True)
         except Exception as e:
             tkinter.messagebox.showerror("Error saving file", str(e))
+        finally:
+            for artist in animated_artists:
+                artist.set_animated(True)
+            # 保存時の描画でblit用の背景が上書きされるので描き直す
+            self.canvas.draw()
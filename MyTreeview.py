@@ -26,32 +26,94 @@ class MyTreeview(Treeview):
         self.heading("path_ref", text="path_ref")
         self.heading("fitting", text="fitting")
 
-    def load(self, spec_dict: dict, sort: bool = False, descending: bool = False):
-        self.delete_all()
-        # アイテム挿入
-        if sort:
-            spec_dict = sorted(spec_dict.items(), key=lambda x: x[0], reverse=descending)
-        else:
-            spec_dict = spec_dict.items()
-        for i, (filename, value) in enumerate(spec_dict):
-            calibration = value.calibration.split(', ')[0].strip('[').strip("'") if value.calibration is not None else ""
-            abs_path_raw = value.abs_path_raw if value.abs_path_raw is not None else ""
-            abs_path_ref = value.abs_path_ref if value.abs_path_ref is not None else ""
-            fitting = f'{value.fitting_function} {value.fitting_range}' if value.fitting_function is not None else ""
-            values = [filename, calibration, abs_path_raw, abs_path_ref, fitting]
-            self.insert(
-                '',
-                END,
-                iid=str(i),
-                text=str(i),
-                values=values,
-                open=True,
-                )
+        # 全て作り直さずに差分だけ反映するため，表示中の内容を覚えておく
+        # Treeview自体は見えている行しか描画しないので，アイテムの作成・削除を減らせばよい
+        self.iids = {}  # {filename: iid}
+        self.filenames = {}  # {iid: filename}
+        self.row_values = {}  # {iid: values}
+        self.row_texts = {}  # {iid: 行番号}
+        self.calibrations = {}  # {value.calibration: 表示用の文字列}
+        self.sort_state = None  # (ファイル名のタプル, descending, 並べ替えた順番)
+        self.sort_mode = (False, False)  # (sort, descending)．フィッティングや保存の後の表示更新でも並べ方を保つ
+        self.num_created = 0
+
+    def get_calibration(self, calibration: str) -> str:
+        # 同じ較正ファイルを使うスペクトルが多いので，文字列の分解は1回だけにする
+        if calibration is None:
+            return ""
+        text = self.calibrations.get(calibration)
+        if text is None:
+            text = calibration.split(', ')[0].strip('[').strip("'")
+            self.calibrations[calibration] = text
+        return text
+
+    def make_values(self, filename: str, value) -> tuple:
+        calibration = self.get_calibration(value.calibration)
+        abs_path_raw = value.abs_path_raw if value.abs_path_raw is not None else ""
+        abs_path_ref = value.abs_path_ref if value.abs_path_ref is not None else ""
+        fitting = f'{value.fitting_function} {value.fitting_range}' if value.fitting_function is not None else ""
+        return filename, calibration, abs_path_raw, abs_path_ref, fitting
+
+    def get_order(self, spec_dict: dict, sort: bool, descending: bool) -> list:
+        if not sort:
+            return list(spec_dict)
+        # ファイルが変わっていなければ前回並べ替えた結果を使う
+        filenames = tuple(spec_dict)
+        if self.sort_state is None or self.sort_state[:2] != (filenames, descending):
+            self.sort_state = (filenames, descending, sorted(filenames, reverse=descending))
+        return self.sort_state[2]
+
+    def load(self, spec_dict: dict, sort: bool = None, descending: bool = False):
+        # 前回の表示と比べて，消えた行の削除・新しい行の挿入・変わった値の更新・並べ替えだけを行う
+        # sortを省略すると前回と同じ並べ方にする
+        if sort is None:
+            sort, descending = self.sort_mode
+        self.sort_mode = (sort, descending)
+        removed = [iid for filename, iid in self.iids.items() if filename not in spec_dict]
+        if len(removed) > 0:
+            self.delete(*removed)
+
+        order = self.get_order(spec_dict, sort, descending)
+        iids = []
+        for i, filename in enumerate(order):
+            values = self.make_values(filename, spec_dict[filename])
+            iid = self.iids.get(filename)
+            if iid is None:
+                iid = f'I{self.num_created}'
+                self.num_created += 1
+                self.insert('', END, iid=iid, text=str(i), values=values, open=True)
+                self.iids[filename] = iid
+                self.filenames[iid] = filename
+                self.row_values[iid] = values
+                self.row_texts[iid] = i
+            elif self.row_values[iid] != values:
+                self.item(iid, values=values)
+                self.row_values[iid] = values
+            iids.append(iid)
+
+        if list(self.get_children()) != iids:
+            self.set_children('', *iids)
+
+        # 行番号は位置が変わった行だけ書き換える
+        for i, iid in enumerate(iids):
+            if self.row_texts.get(iid) != i:
+                self.item(iid, text=str(i))
+                self.row_texts[iid] = i
+
+    def delete(self, *items):
+        Treeview.delete(self, *items)
+        for iid in items:
+            filename = self.filenames.pop(iid, None)
+            if filename is not None:
+                del self.iids[filename]
+            self.row_values.pop(iid, None)
+            self.row_texts.pop(iid, None)
 
     def delete_all(self):
         # アイテム削除
-        for i in self.get_children():
-            self.delete(i)
+        children = self.get_children()
+        if len(children) > 0:
+            self.delete(*children)
 
     def get_filename(self, iid: str = None):
         if len(self.get_children()) == 0:
@@ -59,4 +121,7 @@ class MyTreeview(Treeview):
         if iid is None or iid == '':
             iid = self.get_children()[0]
             self.selection_add(self.get_children())  # 全選択
-        return self.item(iid)['values'][0]
+        filename = self.filenames.get(iid)
+        if filename is None:
+            return self.item(iid)['values'][0]
+        return filename
@@ -0,0 +1,104 @@
+import numpy as np
+from scipy.signal import find_peaks, find_peaks_cwt, peak_prominences, peak_widths, savgol_filter
+from fitting import pseudo_voigt_width
+
+# ピークを検出して，フィッティングの初期値（位置・強度・幅とバックグラウンド）を推定する
+
+
+def estimate_background(x: np.ndarray, y: np.ndarray, edge: float = 0.05) -> (float, float):
+    # 範囲の両端（それぞれ点数のedgeの割合）の中央値を通る直線
+    n = max(1, int(len(x) * edge))
+    x_l, y_l = np.median(x[:n]), np.median(y[:n])
+    x_r, y_r = np.median(x[-n:]), np.median(y[-n:])
+    if x_r == x_l:
+        return 0.0, float(y_l)
+    a = (y_r - y_l) / (x_r - x_l)
+    b = y_l - a * x_l
+    return float(a), float(b)
+
+
+def estimate_noise(y: np.ndarray) -> float:
+    # 隣り合う点の差の中央絶対偏差から，ガウスノイズの標準偏差を推定する
+    d = np.diff(y)
+    return float(np.median(np.abs(d - np.median(d))) * 1.4826 / np.sqrt(2))
+
+
+def smooth(y: np.ndarray) -> np.ndarray:
+    # 検出用にノイズを抑える（点数の1%程度の窓のSavitzky-Golay）
+    window = max(5, len(y) // 100) | 1
+    if len(y) <= window:
+        return y
+    return savgol_filter(y, window, 2)
+
+
+def detect_peaks(y: np.ndarray, method: str = 'prominence', prominence: float = None,
+                 noise: float = None) -> np.ndarray:
+    # ピークのインデックスを返す
+    # yは平滑化済みのもの，noiseは平滑化前のノイズの標準偏差
+    if method == 'prominence':
+        if prominence is None:
+            if noise is None:
+                noise = estimate_noise(y)
+            prominence = max(5 * noise, 0.02 * (y.max() - y.min()))
+        peaks, _ = find_peaks(y, prominence=prominence)
+    elif method == 'cwt':
+        peaks = np.asarray(find_peaks_cwt(y, widths=np.arange(2, max(3, len(y) // 20))), dtype=int)
+    else:
+        raise ValueError(f'Unsupported method: {method}')
+    return peaks
+
+
+def width_to_params(function: str, fwhm: float) -> list:
+    # 半値全幅から各関数の幅パラメータへ
+    if function == 'Lorentzian':
+        return [fwhm]
+    elif function == 'Gaussian':
+        return [fwhm / (2 * np.sqrt(2 * np.log(2)))]
+    elif function in ('Voigt', 'PseudoVoigt'):
+        # Lorentz成分とGauss成分の半値全幅を半分ずつにし，全体の半値全幅がfwhmになるよう拡大する
+        lw = 0.25
+        gw = 0.5 / (2 * np.sqrt(2 * np.log(2)))
+        f, _ = pseudo_voigt_width(lw, gw)
+        scale = fwhm / float(f)
+        return [lw * scale, gw * scale]
+    else:
+        raise ValueError(f'Unsupported function name: {function}')
+
+
+def estimate_params(x: np.ndarray, y: np.ndarray, xlim: list, function: str,
+                    num_peaks: int = None, method: str = 'prominence', prominence: float = None) -> list:
+    # Fit.set_paramsにそのまま渡せる初期値（ピークごとに並べ，最後にバックグラウンド）を返す
+    # num_peaksを指定した場合は目立つものからその数だけ使う
+    x = np.asarray(x)
+    y = np.asarray(y)
+    fit_range = (min(xlim) <= x) & (x <= max(xlim))
+    x = x[fit_range]
+    y = y[fit_range]
+    order = np.argsort(x, kind='stable')
+    x = x[order]
+    y = y[order]
+    if len(x) < 3:
+        return [0.0, 0.0]
+
+    a, b = estimate_background(x, y)
+    y_corr = smooth(y - (a * x + b))
+    peaks = detect_peaks(y_corr, method, prominence, estimate_noise(y))
+    if len(peaks) == 0:
+        return [a, b]
+
+    prominences = peak_prominences(y_corr, peaks)[0]
+    if num_peaks is not None:
+        peaks = peaks[np.argsort(prominences)[::-1][:num_peaks]]
+        peaks = np.sort(peaks)
+
+    # 半値全幅（インデックス単位）をxの単位に直す
+    _, _, left, right = peak_widths(y_corr, peaks, rel_height=0.5)
+    index = np.arange(len(x))
+    fwhms = np.abs(np.interp(right, index, x) - np.interp(left, index, x))
+    fwhms = np.maximum(fwhms, np.min(np.diff(x)) if len(x) > 1 else 1e-10)
+
+    params = []
+    for peak, fwhm in zip(peaks, fwhms):
+        params += [float(x[peak]), float(y_corr[peak])] + [float(w) for w in width_to_params(function, fwhm)]
+    params += [a, b]
+    return params
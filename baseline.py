@@ -0,0 +1,102 @@
+import numpy as np
+
+# ベースライン（蛍光などのなだらかなバックグラウンド）の推定
+# フィッティングの前に差し引いておくと，ピークだけのモデルで済み，収束も速くなる
+# yは1次元でも，同じxを持つスペクトルを並べた2次元配列(スペクトル数, 点数)でもよい
+# いずれも点数に比例する時間で計算できる
+
+METHODS = ('ALS', 'Polynomial', 'RollingBall')
+
+# 各手法の既定のパラメータ（ALS: 平滑化の強さλ, Polynomial: 次数, RollingBall: 半径[点]）
+DEFAULT_PARAMS = {'ALS': 1e5, 'Polynomial': 3, 'RollingBall': 50}
+
+
+def second_difference_bands(n: int) -> (np.ndarray, np.ndarray, np.ndarray):
+    # D^T D（Dは2階差分の(n-2, n)行列）の対角・1つ上・2つ上の成分
+    i = np.arange(n)
+    main = (i <= n - 3) * 1.0 + ((1 <= i) & (i <= n - 2)) * 4.0 + (i >= 2) * 1.0
+    i = np.arange(n - 1)
+    off1 = (i <= n - 3) * -2.0 + ((1 <= i) & (i <= n - 2)) * -2.0
+    off2 = np.ones(n - 2)
+    return main, off1, off2
+
+
+def als_baseline(y: np.ndarray, lam: float = 1e5, p: float = 0.01, num_iter: int = 10) -> np.ndarray:
+    # Asymmetric Least Squares (Eilers & Boelens)
+    # (W + λ D^T D) z = W y は5重対角の対称行列なので，帯行列のまま解く
+    # ベースラインより上の点（ピーク）の重みをp，下の点の重みを1-pにして繰り返す
+    from scipy.linalg import solveh_banded
+
+    y = np.asarray(y, dtype=float)
+    if y.ndim == 2:
+        return np.stack([als_baseline(row, lam, p, num_iter) for row in y]) if len(y) > 0 else y.copy()
+    n = len(y)
+    if n < 3:
+        return y.copy()
+    main, off1, off2 = second_difference_bands(n)
+    ab = np.zeros((3, n))  # solveh_bandedの上三角の形式
+    ab[0, 2:] = lam * off2
+    ab[1, 1:] = lam * off1
+    w = np.ones(n)
+    for _ in range(num_iter):
+        ab[2] = lam * main + w
+        z = solveh_banded(ab, w * y, check_finite=False)
+        w_new = np.where(y > z, p, 1 - p)
+        if np.array_equal(w_new, w):
+            break
+        w = w_new
+    return z
+
+
+def polynomial_baseline(x: np.ndarray, y: np.ndarray, degree: int = 3, num_iter: int = 100, tol: float = 1e-3) -> np.ndarray:
+    # 多項式で近似し，近似より上の点を近似値で置き換えて繰り返す（modified polyfit）
+    # 最小二乗の擬似逆行列は全スペクトルで共通なので，2次元配列のまままとめて計算する
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    t = (x - x.mean()) / (np.ptp(x) / 2 if np.ptp(x) > 0 else 1)  # 条件数を小さくするため[-1, 1]に
+    vander = np.vander(t, int(degree) + 1)
+    projection = np.ascontiguousarray(np.linalg.pinv(vander).T)
+    y_active = y.reshape(-1, y.shape[-1]).copy()
+    base = np.empty_like(y_active)
+    scale = np.maximum(np.sqrt(np.einsum('ij,ij->i', y_active, y_active)), np.finfo(float).tiny)
+    # 置き換えによる変化が相対的にtol以下になった行は計算から外す
+    active = np.arange(len(y_active))
+    for _ in range(num_iter):
+        base_active = (y_active @ projection) @ vander.T
+        excess = np.maximum(y_active - base_active, 0)
+        y_active -= excess
+        done = np.sqrt(np.einsum('ij,ij->i', excess, excess)) <= tol * scale[active]
+        if done.all():
+            break
+        if done.any():
+            base[active[done]] = base_active[done]
+            active = active[~done]
+            y_active = y_active[~done]
+            base_active = base_active[~done]
+    base[active] = base_active
+    return base.reshape(y.shape)
+
+
+def rolling_ball_baseline(y: np.ndarray, radius: int = 50) -> np.ndarray:
+    # 下から球（ここでは平らな窓）を転がした軌跡: 最小値フィルタの後に最大値フィルタ（モルフォロジーのopening）
+    # 角ばるので同じ幅の移動平均で滑らかにする．フィルタは最後の軸に沿ってかけるので2次元配列もそのまま
+    from scipy.ndimage import minimum_filter1d, maximum_filter1d, uniform_filter1d
+
+    y = np.asarray(y, dtype=float)
+    size = 2 * max(1, int(radius)) + 1
+    opened = maximum_filter1d(minimum_filter1d(y, size, axis=-1, mode='nearest'), size, axis=-1, mode='nearest')
+    return np.minimum(uniform_filter1d(opened, size, axis=-1, mode='nearest'), y)
+
+
+def estimate_baseline(x: np.ndarray, y: np.ndarray, method: str, param: float = None) -> np.ndarray:
+    if param is None:
+        param = DEFAULT_PARAMS[method]
+    if method == 'ALS':
+        return als_baseline(y, lam=param)
+    elif method == 'Polynomial':
+        return polynomial_baseline(x, y, degree=int(param))
+    elif method == 'RollingBall':
+        return rolling_ball_baseline(y, radius=int(param))
+    else:
+        raise ValueError(f'Unsupported baseline method: {method}')
+
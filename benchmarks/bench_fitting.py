@@ -0,0 +1,140 @@
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from fitting import Fit  # noqa: E402
+from synthetic import make_spectrum  # noqa: E402
+
+# fitting.Fit.fitのベンチマーク
+# 人工スペクトルでピーク数・点数・ノイズ・関数を変え，時間・関数評価回数・収束率を測る
+# 例:
+#   python benchmarks/bench_fitting.py --save-baseline   # 基準を保存
+#   python benchmarks/bench_fitting.py --compare         # 基準と比較（遅くなっていれば終了コード1）
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_fitting.json')
+
+GRID_QUICK = {
+    'function': ('Lorentzian', 'Gaussian', 'Voigt', 'PseudoVoigt'),
+    'num_peaks': (1, 10),
+    'num_points': (500, 5000),
+    'noise': (0.02,),
+}
+GRID_FULL = {
+    'function': ('Lorentzian', 'Gaussian', 'Voigt', 'PseudoVoigt'),
+    'num_peaks': (1, 5, 20, 50),
+    'num_points': (500, 5000, 100000),
+    'noise': (0.01, 0.05),
+}
+
+
+def is_converged(fitter: Fit, params_true: list) -> bool:
+    # ピーク位置が全て幅の1/4以内に戻っていれば収束とみなす
+    if fitter.params_fit is None or not np.all(np.isfinite(fitter.params_fit)):
+        return False
+    centers_fit = fitter.split_params(fitter.params_fit)[0].ravel()
+    centers_true = fitter.split_params(params_true)[0].ravel()
+    widths = np.abs(fitter.split_params(params_true)[2].ravel())
+    return bool(np.all(np.abs(centers_fit - centers_true) < widths / 4))
+
+
+def run_case(function: str, num_peaks: int, num_points: int, noise: float, trials: int) -> dict:
+    times = []
+    nfevs = []
+    num_converged = 0
+    for seed in range(trials):
+        x, y, params_true, p0 = make_spectrum(function, num_peaks, num_points, noise, seed)
+        fitter = Fit()
+        fitter.set_function(function)
+        fitter.set_data(x, y, [x[0], x[-1]])
+        fitter.set_params(p0)
+
+        start = time.perf_counter()
+        ok = fitter.fit()
+        times.append(time.perf_counter() - start)
+        if fitter.stats['nfev'] is not None:
+            nfevs.append(fitter.stats['nfev'])
+        if ok and is_converged(fitter, params_true):
+            num_converged += 1
+
+    return {
+        'time': statistics.median(times),
+        'nfev': statistics.median(nfevs) if len(nfevs) > 0 else 0,
+        'convergence': num_converged / trials,
+    }
+
+
+def case_name(function: str, num_peaks: int, num_points: int, noise: float) -> str:
+    return f'{function}-peaks{num_peaks}-points{num_points}-noise{noise}'
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    # 基準より遅い・評価回数が多い・収束率が下がったケースを返す
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        # 1ms未満の差は測定のばらつきとして無視する
+        if result['time'] > base['time'] * tolerance and result['time'] - base['time'] > 1e-3:
+            regressions.append(f'{name}: time {base["time"]:.4f}s -> {result["time"]:.4f}s')
+        if result['nfev'] > base['nfev'] * tolerance:
+            regressions.append(f'{name}: nfev {base["nfev"]} -> {result["nfev"]}')
+        if result['convergence'] < base['convergence'] - 0.1:
+            regressions.append(f'{name}: convergence {base["convergence"]:.2f} -> {result["convergence"]:.2f}')
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark fitting.Fit.fit on synthetic multi-peak spectra.')
+    parser.add_argument('--full', action='store_true', help='run the full grid (1-50 peaks, 500-100k points)')
+    parser.add_argument('--trials', type=int, default=5, help='spectra per case (different noise seeds)')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the baseline and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=1.3, help='allowed slowdown factor for --compare')
+    args = parser.parse_args()
+
+    grid = GRID_FULL if args.full else GRID_QUICK
+    results = {}
+    print(f'{"case":<45}{"time [s]":>12}{"nfev":>8}{"conv.":>8}')
+    for function, num_peaks, num_points, noise in itertools.product(*grid.values()):
+        name = case_name(function, num_peaks, num_points, noise)
+        result = run_case(function, num_peaks, num_points, noise, args.trials)
+        results[name] = result
+        print(f'{name:<45}{result["time"]:>12.4f}{result["nfev"]:>8}{result["convergence"]:>8.2f}')
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f'baseline saved to {args.baseline}')
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f'baseline not found: {args.baseline}', file=sys.stderr)
+            return 1
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print('regressions:')
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print('no regressions')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
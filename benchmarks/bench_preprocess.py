@@ -0,0 +1,84 @@
+import argparse
+import os
+import statistics
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocess import PreprocessCache, run_pipeline  # noqa: E402
+
+# 前処理のパイプラインにかかる時間を測る
+# マッピング測定を想定して，同じxを持つスペクトル（宇宙線のスパイク入り）をN本まとめて処理する
+# 例: python benchmarks/bench_preprocess.py --num-spectra 100 1000 --num-points 1024
+
+CASES = {
+    'despike': (('despike', 6.0),),
+    'smooth (SG)': (('smooth', 11, 2),),
+    'baseline ALS': (('baseline', 'ALS', 1e5),),
+    'baseline Polynomial': (('baseline', 'Polynomial', 3),),
+    'baseline RollingBall': (('baseline', 'RollingBall', 50),),
+    'normalize max': (('normalize', 'max', None),),
+    'normalize area': (('normalize', 'area', None),),
+    'resample': (('resample', 1000),),
+    'despike+smooth+norm': (('despike', 6.0), ('smooth', 11, 2), ('normalize', 'max', None)),
+}
+
+
+def make_data(num_spectra: int, num_points: int) -> dict:
+    rng = np.random.default_rng(0)
+    x = np.linspace(500, 600, num_points)
+    centers = rng.uniform(520, 580, num_spectra)
+    y = 1000 * np.exp(-(x - centers[:, np.newaxis]) ** 2 / 2) + 100 + 0.5 * (x - 500) + rng.normal(0, 10, (num_spectra, num_points))
+    spikes = rng.integers(0, num_points, num_spectra)
+    y[np.arange(num_spectra), spikes] += 5000
+    return {f'spectrum_{i:05d}': (x, y[i]) for i in range(num_spectra)}
+
+
+def measure(func, repeats: int) -> float:
+    # 中央値 [ms]．最初の1回はscipyの読み込みが入るので捨てる
+    func()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def run(num_spectra: int, num_points: int, repeats: int) -> dict:
+    data = make_data(num_spectra, num_points)
+    result = {name: measure(lambda: run_pipeline(data, pipeline), repeats) for name, pipeline in CASES.items()}
+
+    # キャッシュ済みなら何も計算しない．1本だけ差し替えた場合はその1本だけ計算する
+    pipeline = CASES['despike+smooth+norm']
+    cache = PreprocessCache()
+    cache.apply_all(data, pipeline)
+    result['cached (no change)'] = measure(lambda: cache.apply_all(data, pipeline), repeats)
+
+    def replace_one():
+        name = next(iter(data))
+        x, y = data[name]
+        data[name] = (x, y.copy())
+        cache.apply_all(data, pipeline)
+    result['cached (1 changed)'] = measure(replace_one, repeats)
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark the preprocessing pipeline on a stack of synthetic spectra.')
+    parser.add_argument('--num-spectra', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--num-points', type=int, default=1024, help='points per spectrum')
+    parser.add_argument('--repeats', type=int, default=5, help='repetitions per case (median is reported)')
+    args = parser.parse_args()
+
+    results = {num_spectra: run(num_spectra, args.num_points, args.repeats) for num_spectra in args.num_spectra}
+    names = list(next(iter(results.values())).keys())
+    print(f'{"step [ms]":<26}' + ''.join(f'{f"N={n}":>12}' for n in results))
+    for name in names:
+        print(f'{name:<26}' + ''.join(f'{results[n][name]:>12.1f}' for n in results))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
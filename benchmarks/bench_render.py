@@ -0,0 +1,223 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np  # noqa: E402
+from matplotlib.backends.backend_agg import FigureCanvasAgg  # noqa: E402
+import matplotlib.pyplot as plt  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main as pgraph  # noqa: E402
+
+# PGraphの描画まわりの操作にかかる時間を測る
+# ディスプレイがなくても動くように，Aggバックエンドのキャンバスを使い，
+# Tkのウィジェット（入力欄・リスト）は最小限の代用品に置き換える
+# 例: python benchmarks/bench_render.py --num-spectra 10 100 1000 5000
+
+logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+
+
+class Variable:
+    # tk.StringVar, ttk.Entryなどの代用品
+    def __init__(self, value=''):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value) -> None:
+        self.value = value
+
+
+class Treeview:
+    # MyTreeviewの代用品．表示順はspec_dictの順番
+    def __init__(self, spec_dict: dict):
+        self.filenames = list(spec_dict.keys())
+        self.selected = ()
+        self.row = ''
+
+    def get_children(self) -> tuple:
+        return tuple(str(i) for i in range(len(self.filenames)))
+
+    def selection(self) -> tuple:
+        return self.selected
+
+    def identify_row(self, y) -> str:
+        return self.row
+
+    def get_filename(self, iid: str = None):
+        if len(self.filenames) == 0:
+            return None
+        if iid is None or iid == '':
+            return self.filenames[0]
+        return self.filenames[int(iid)]
+
+
+class SyntheticSpectrum:
+    # DataLoaderのスペクトルのうち，PGraphの描画で使う属性だけを持つ
+    def __init__(self, xdata: np.ndarray, ydata: np.ndarray):
+        self.xdata = xdata
+        self.ydata = ydata
+        self.device = 'CCS'
+        self.calibration = None
+        self.abs_path_raw = None
+        self.abs_path_ref = None
+        self.fitting_function = None
+        self.fitting_range = None
+        self.fitting_values = []
+        self.color = 'black'
+        self.linestyle = 'solid'
+        self.y_shift = 0
+        self.y_times = 1
+        self.highlight = False
+
+
+class Event:
+    y = 0
+
+
+class ResultStore(pgraph.ResultStore):
+    # 結果のデータベースはメモリ上に置き，~/.pgraph/results.sqliteを作らない
+    def __init__(self):
+        super().__init__(':memory:')
+
+
+def build_app(num_spectra: int, num_points: int) -> pgraph.PGraph:
+    pgraph.ResultStore = ResultStore
+    app = pgraph.PGraph.__new__(pgraph.PGraph)
+    app.init_state()
+    app.spec_cache = None
+    app.create_graph()
+    app.canvas = FigureCanvasAgg(app.fig)
+    app.connect_canvas_events()
+
+    app.x_labels = pgraph.x_labels
+    app.y_labels = pgraph.y_labels
+    app.x_label = Variable(pgraph.x_labels[0])
+    app.laser_wavelength = Variable('')
+    app.y_label = Variable(pgraph.y_labels[0])
+    app.x_labelsize = Variable('35')
+    app.y_labelsize = Variable('35')
+    app.xtick_labelsize = Variable('25')
+    app.ytick_labelsize = Variable('25')
+    app.entry_xmin = Variable('')
+    app.entry_xmax = Variable('')
+    app.entry_ymin = Variable('')
+    app.entry_ymax = Variable('')
+    app.xticks = Variable('auto')
+    app.yticks = Variable('auto')
+    app.if_show = Variable(False)
+    app.linecolor = ['red']
+    app.linestyle = Variable('solid')
+    app.set_linecolor = lambda code: None
+    app.y_shift_value = Variable(0)
+    app.y_times_value = Variable(1)
+    app.y_shift_each_value = Variable(0)
+
+    rng = np.random.default_rng(0)
+    x = np.linspace(400, 800, num_points)
+    for i in range(num_spectra):
+        center = rng.uniform(450, 750)
+        y = 1000 * np.exp(-(x - center) ** 2 / 200) + rng.normal(0, 10, num_points)
+        app.dl.spec_dict[f'spectrum_{i:05d}.txt'] = SyntheticSpectrum(x, y)
+    app.treeview_file = Treeview(app.dl.spec_dict)
+
+    # フィッティング結果（1本目のスペクトルをLorentzianでフィット）
+    spec = app.dl.spec_dict['spectrum_00000.txt'] if num_spectra > 0 else None
+    if spec is not None:
+        center = spec.xdata[np.argmax(spec.ydata)]
+        app.fitter.set_data(spec.xdata, spec.ydata, [center - 50, center + 50])
+        app.fitter.set_params([center, 1000, 20, 0, 0])
+        app.fitter.fit()
+    return app
+
+
+def measure(func, repeats: int) -> float:
+    # 中央値 [ms]
+    times = []
+    for i in range(repeats):
+        start = time.perf_counter()
+        func(i)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+def run(num_spectra: int, num_points: int, repeats: int) -> dict:
+    app = build_app(num_spectra, num_points)
+    result = {}
+
+    result['refresh (initial)'] = measure(lambda i: app.refresh(), 1)
+    result['refresh (no change)'] = measure(lambda i: app.refresh(), repeats)
+
+    def change_unit(i):
+        app.x_label.set(pgraph.x_labels[1] if i % 2 == 0 else pgraph.x_labels[0])
+        app.refresh()
+    result['refresh (x unit)'] = measure(change_unit, repeats)
+    app.x_label.set(pgraph.x_labels[0])
+    app.refresh()
+
+    def select(i):
+        app.treeview_file.row = str(i % max(num_spectra, 1))
+        app.select(Event())
+    result['select'] = measure(select, repeats)
+
+    def apply_option(i):
+        app.treeview_file.selected = (str(i % max(num_spectra, 1)),)
+        app.y_shift_value.set(i + 1)
+        app.apply_option()
+    result['apply_option'] = measure(apply_option, repeats)
+    app.treeview_file.selected = ()
+
+    def apply_option_advanced(i):
+        app.y_shift_each_value.set(10 * (i + 1))
+        app.apply_option_advanced()
+    result['apply_option_advanced'] = measure(apply_option_advanced, repeats)
+
+    def preprocess(i):
+        app.pipeline = (('despike', 6.0), ('smooth', 11, 2), ('normalize', 'max', None)) if i % 2 == 0 else ()
+        app.refresh()
+    result['refresh (preprocess)'] = measure(preprocess, repeats)
+    app.pipeline = ()
+    app.refresh()
+
+    def fit_overlay(i):
+        app.if_show.set(i % 2 == 0)
+        app.refresh()
+    result['fit overlay (Fit.draw)'] = measure(fit_overlay, repeats)
+
+    plt.close(app.fig)
+    app.spec_store.close()
+    app.result_store.close()
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark PGraph rendering interactions headlessly (Agg backend).')
+    parser.add_argument('--num-spectra', type=int, nargs='+', default=[10, 100, 1000, 5000])
+    parser.add_argument('--num-points', type=int, default=1000, help='points per spectrum')
+    parser.add_argument('--repeats', type=int, default=5, help='repetitions per interaction (median is reported)')
+    parser.add_argument('--json', default=None, help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    results = {}
+    for num_spectra in args.num_spectra:
+        results[num_spectra] = run(num_spectra, args.num_points, args.repeats)
+
+    names = list(next(iter(results.values())).keys())
+    print(f'{"interaction [ms]":<26}' + ''.join(f'{f"N={n}":>12}' for n in results))
+    for name in names:
+        print(f'{name:<26}' + ''.join(f'{results[n][name]:>12.1f}' for n in results))
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
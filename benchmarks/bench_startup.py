@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# 起動時のimportにかかる時間のレポート
+# python -X importtimeで各モジュールを別プロセスで読み込み，合計時間と重いimportを表示する
+# 起動時に読み込まないことにしているモジュール（scipyなど）が読み込まれていないかも確認する
+# 例:
+#   python benchmarks/bench_startup.py --save-baseline   # 基準を保存
+#   python benchmarks/bench_startup.py --compare         # 基準と比較（遅くなっていれば終了コード1）
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_startup.json')
+
+MODULES = ('main', 'cli', 'fitting')
+
+# 各モジュールを読み込んだだけでは読み込まれてはいけないもの（使うときに読み込む）
+DEFERRED = {
+    'main': ('scipy', 'pandas', 'dataloader', 'autoguess'),
+    'cli': ('scipy', 'pandas', 'dataloader', 'matplotlib', 'tkinter'),
+    'fitting': ('scipy', 'matplotlib'),
+}
+
+
+def measure_imports(module: str) -> (dict, dict):
+    # ({モジュール名: 累積時間[s]}, {moduleが直接importしたもの: 累積時間[s]})
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([ROOT] + [p for p in env.get('PYTHONPATH', '').split(os.pathsep) if p != ''])
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                               cwd=ROOT, env=env, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{completed.stderr.strip().splitlines()[-1]}')
+    times = {}
+    direct = {}
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip(' ')) - 1) // 2  # 字下げがimportの深さ
+        times[name.strip()] = int(cumulative) / 1e6
+        if depth == 1:
+            direct[name.strip()] = int(cumulative) / 1e6
+    return times, direct
+
+
+def run(module: str, repeats: int, top: int) -> dict:
+    # 最初の1回は.pycの作成などが入るので捨て，残りの最小値を使う
+    measure_imports(module)
+    runs = [measure_imports(module) for _ in range(repeats)]
+    times, direct = min(runs, key=lambda run: run[0][module])
+    heaviest = sorted(direct.items(), key=lambda item: item[1], reverse=True)[:top]
+    loaded = [name for name in DEFERRED.get(module, ()) if name in times]
+    return {'time': times[module], 'heaviest': heaviest, 'loaded_deferred': loaded}
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for module, result in results.items():
+        if len(result['loaded_deferred']) > 0:
+            regressions.append(f'{module}: imports {", ".join(result["loaded_deferred"])} at startup')
+        base = baseline.get(module)
+        if base is None:
+            continue
+        # 20ms未満の差は測定のばらつきとして無視する
+        if result['time'] > base['time'] * tolerance and result['time'] - base['time'] > 0.02:
+            regressions.append(f'{module}: {base["time"]:.3f}s -> {result["time"]:.3f}s')
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Report the import time of the PGraph modules (python -X importtime).')
+    parser.add_argument('modules', nargs='*', default=MODULES, help='modules to import')
+    parser.add_argument('--repeats', type=int, default=3, help='runs per module (the fastest is reported)')
+    parser.add_argument('--top', type=int, default=8, help='number of heaviest direct imports to show')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare against the baseline and fail on regressions')
+    parser.add_argument('--tolerance', type=float, default=1.3, help='allowed slowdown factor for --compare')
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        result = run(module, args.repeats, args.top)
+        results[module] = result
+        print(f'import {module}: {result["time"]:.3f} s')
+        for name, t in result['heaviest']:
+            print(f'  {name:<30}{t:>8.3f} s')
+        if len(result['loaded_deferred']) > 0:
+            print(f'  loaded at startup (should be deferred): {", ".join(result["loaded_deferred"])}')
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update({module: {'time': result['time']} for module, result in results.items()})
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+        print(f'baseline saved to {args.baseline}')
+
+    if args.compare:
+        if not os.path.exists(args.baseline):
+            print(f'baseline not found: {args.baseline}', file=sys.stderr)
+            return 1
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if len(regressions) > 0:
+            print('regressions:')
+            for regression in regressions:
+                print('  ' + regression)
+            return 1
+        print('no regressions')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import numpy as np
+
+# ベンチマーク用の人工スペクトル
+# ピークは範囲の10%〜90%に等間隔に並べ，隣のピークと重なりすぎない幅にする
+
+X_RANGE = (0.0, 1000.0)
+
+
+def make_peak_params(function: str, num_peaks: int, rng: np.random.Generator) -> list:
+    # 真のパラメータ（ピークごとに並べ，最後にバックグラウンドa, b）
+    spacing = (X_RANGE[1] - X_RANGE[0]) * 0.8 / num_peaks
+    width = spacing / 6
+    centers = X_RANGE[0] + (X_RANGE[1] - X_RANGE[0]) * 0.1 + spacing * (np.arange(num_peaks) + 0.5)
+    params = []
+    for center in centers:
+        intensity = rng.uniform(500, 1000)
+        if function in ('Voigt', 'PseudoVoigt'):
+            params += [center, intensity, width / 2, width / 2]
+        else:
+            params += [center, intensity, width]
+    params += [0.05, 10.0]
+    return params
+
+
+def perturb_params(params: list, num_params_per_func: int, rng: np.random.Generator, scale: float = 0.2) -> list:
+    # 初期値として真の値を少しずらしたものを使う
+    params = list(params)
+    num_func = (len(params) - 2) // num_params_per_func
+    for i in range(num_func):
+        p = params[i * num_params_per_func:(i + 1) * num_params_per_func]
+        width = p[2]
+        p[0] += rng.uniform(-scale, scale) * width
+        for j in range(1, num_params_per_func):
+            p[j] *= rng.uniform(1 - scale, 1 + scale)
+        params[i * num_params_per_func:(i + 1) * num_params_per_func] = p
+    params[-2:] = [0.0, 0.0]
+    return params
+
+
+def make_spectrum(function: str, num_peaks: int, num_points: int, noise: float, seed: int = 0):
+    # noise: 最大強度に対するガウスノイズの標準偏差の比
+    # 戻り値: x, y, 真のパラメータ, 初期値
+    from fitting import Fit
+
+    rng = np.random.default_rng(seed)
+    fitter = Fit()
+    fitter.set_function(function)
+    params = make_peak_params(function, num_peaks, rng)
+    fitter.set_params(params)
+
+    x = np.linspace(X_RANGE[0], X_RANGE[1], num_points)
+    y = fitter.superposition(x, *params).copy()
+    y += rng.normal(0, noise * y.max(), num_points)
+    p0 = perturb_params(params, fitter.num_params_per_func, rng)
+    return x, y, params, p0
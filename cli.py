@@ -0,0 +1,235 @@
+import argparse
+import csv
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+from baseline import METHODS as baseline_methods
+from fitlog import write_fit_log
+from fitting import Fit, fit_spectrum_with_stats, fit_spectra_sequential, fit_spectra_global
+from ingest import load_file
+from xaxis import WAVELENGTH, ENERGY, convert, get_source_unit
+
+# GUIを使わずにフィッティングするためのコマンドラインツール
+# tkinter・tkinterdnd2・GUI用のmatplotlibバックエンドは読み込まない
+# 例: python cli.py "data/*.txt" -f Voigt -p params.txt -r 1.5 2.5 -o results.csv
+# -pを省略するとスペクトルごとにピークを検出して初期値を推定する
+# --sharedを指定すると，そのパラメータを全スペクトルで共通にして同時にフィッティングする
+# --baselineを指定すると，フィッティングの前にベースラインを差し引く
+
+functions = ('Lorentzian', 'Gaussian', 'Voigt', 'PseudoVoigt')
+
+# 結果の表に出力するFit.statsの項目
+stats_columns = ['time', 'nfev', 'iterations', 'residual_norm', 'cond', 'num_points']
+
+param_names = {
+    'Lorentzian': ('center', 'intensity', 'width'),
+    'Gaussian': ('center', 'intensity', 'sigma'),
+    'Voigt': ('center', 'intensity', 'lw', 'gw'),
+    'PseudoVoigt': ('center', 'intensity', 'lw', 'gw'),
+}
+
+
+def get_shared_indices(names: list, function: str) -> list:
+    # パラメータ名（center, intensity, width）からピーク内の番号へ
+    num_params_per_func = len(param_names[function])
+    indices = []
+    for name in names:
+        if name == 'center':
+            indices.append(0)
+        elif name == 'intensity':
+            indices.append(1)
+        elif name == 'width':
+            indices.extend(range(2, num_params_per_func))
+    return indices
+
+
+def read_params(path: str) -> list:
+    # GUIの初期値欄と同じ形式（1行に1ピーク，最後の行がバックグラウンド）
+    with open(path) as f:
+        return [float(value) for line in f for value in line.split()]
+
+
+def find_files(patterns: list) -> list:
+    filenames = []
+    for pattern in patterns:
+        filenames.extend(sorted(glob.glob(pattern, recursive=True)))
+    return list(dict.fromkeys(filenames))  # 重複を除く
+
+
+def get_xdata(spec, energy: bool) -> np.ndarray:
+    return convert(spec.xdata, get_source_unit(spec), ENERGY if energy else WAVELENGTH)
+
+
+def get_ydata(spec, baseline: tuple = None) -> np.ndarray:
+    # baseline: (method, param)．Noneならそのまま
+    y = np.asarray(spec.ydata, dtype=float)
+    if baseline is None:
+        return y
+    from baseline import estimate_baseline  # scipyを読み込むので使うときに
+    return y - estimate_baseline(np.asarray(spec.xdata, dtype=float), y, *baseline)
+
+
+def try_load_file(filename: str) -> (dict, str):
+    # 読み込めなかった場合は空のdictとエラーメッセージを返す
+    try:
+        return load_file(filename), ''
+    except Exception as e:
+        return {}, f'load failed: {e}'
+
+
+def load_and_fit(filename: str, function: str, params: list, xlim: list, energy: bool, num_peaks: int = None,
+                 baseline: tuple = None) -> list:
+    # 1ファイルを読み込んでフィッティングする．プロセスプールから呼ぶのでトップレベルに置く
+    # paramsがNoneの場合はスペクトルごとに初期値を推定する
+    # 戻り値: [(名前, params_fit, メッセージ, Fit.stats)]．失敗した場合params_fitはNone
+    spec_dict, error = try_load_file(filename)
+    if error != '':
+        return [(filename, None, error, None)]
+    results = []
+    for name, spec in spec_dict.items():
+        x, y = get_xdata(spec, energy), get_ydata(spec, baseline)
+        if params is None:
+            from autoguess import estimate_params  # scipy.signalを読み込むので使うときに
+            p0 = estimate_params(x, y, xlim, function, num_peaks)
+        else:
+            p0 = params
+        params_fit, stats = fit_spectrum_with_stats(x, y, xlim, function, p0)
+        results.append((name, params_fit, '' if params_fit is not None else 'fitting failed', stats))
+    return results
+
+
+def fit_files(filenames: list, function: str, params: list, xlim: list,
+              energy: bool = False, sequential: bool = False, max_workers: int = None, num_peaks: int = None,
+              shared: list = None, baseline: tuple = None) -> list:
+    # ファイルごとに読み込み・フィッティングを行う
+    # sequential=Trueの場合はファイルの順番に，前の結果を次の初期値にする
+    # sharedを指定した場合はそのパラメータ（ピーク内の番号）を共通にして全スペクトルを同時にフィッティングする
+    # paramsがNoneの場合は初期値を推定する（sequential・sharedの場合は最初のスペクトルから）
+    # baselineを指定した場合は各スペクトルからベースラインを差し引いてからフィッティングする
+    if len(filenames) == 0:
+        return []
+
+    if sequential or shared is not None:
+        # 読み込みだけ並列に行い，フィッティングはまとめて
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            loaded = list(executor.map(try_load_file, filenames))
+        data = {}
+        errors = []
+        for filename, (spec_dict, error) in zip(filenames, loaded):
+            if error != '':
+                errors.append((filename, None, error, None))
+            for name, spec in spec_dict.items():
+                data[name] = (get_xdata(spec, energy), get_ydata(spec, baseline))
+        if len(data) == 0:
+            return errors
+        if params is None:
+            from autoguess import estimate_params
+            params = estimate_params(*next(iter(data.values())), xlim, function, num_peaks)
+        stats = {}
+        if shared is not None:
+            results = fit_spectra_global(data, xlim, function, params, shared, stats=stats)
+            # 統計は全体で1つなので各スペクトルに同じものを付ける
+            stats = {name: stats['global'] for name in results}
+        else:
+            results = fit_spectra_sequential(data, xlim, function, params, stats=stats)
+        return errors + [(name, params_fit, '' if params_fit is not None else 'fitting failed', stats.get(name))
+                         for name, params_fit in results.items()]
+
+    n = len(filenames)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    chunksize = max(1, n // (max_workers * 4))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(load_and_fit, filenames, [function] * n, [params] * n, [xlim] * n, [energy] * n,
+                               [num_peaks] * n, [baseline] * n, chunksize=chunksize)
+        return [result for results_file in results for result in results_file]
+
+
+def write_results(results: list, f, function: str, params: list, xlim: list) -> None:
+    # 初期値を推定した場合はピークの数がスペクトルごとに異なるので，最も多いものに列を合わせる
+    fitter = Fit()
+    fitter.set_function(function)
+    num_func = 0
+    if params is not None:
+        fitter.set_params(params)
+        num_func = fitter.num_func
+    for _, params_fit, _, _ in results:
+        if params_fit is not None:
+            num_func = max(num_func, (len(params_fit) - 2) // fitter.num_params_per_func)
+    header = ['filename', 'function', 'xmin', 'xmax', 'success']
+    for i in range(num_func):
+        header += [f'{name}{i}' for name in param_names[function]]
+    header += ['bg_a', 'bg_b']
+    header += stats_columns + ['message']
+
+    writer = csv.writer(f)
+    writer.writerow(header)
+    num_params = num_func * fitter.num_params_per_func + 2
+    for name, params_fit, message, stats in results:
+        if params_fit is None:
+            values = [''] * num_params
+        else:
+            values = list(params_fit[:-2]) + [''] * (num_params - len(params_fit)) + list(params_fit[-2:])
+        values += [''] * len(stats_columns) if stats is None else [stats[column] for column in stats_columns]
+        writer.writerow([name, function, xlim[0], xlim[1], params_fit is not None] + values + [message])
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Fit spectrum files without the GUI and write a results table.')
+    parser.add_argument('patterns', nargs='+', help='file paths or glob patterns (quote them to avoid shell expansion)')
+    parser.add_argument('-f', '--function', choices=functions, default=functions[0], help='peak model')
+    parser.add_argument('-p', '--params', default=None,
+                        help='initial parameter file, same format as the GUI text box (default: estimate from detected peaks)')
+    parser.add_argument('-n', '--num-peaks', type=int, default=None,
+                        help='number of peaks to use when estimating initial parameters (default: all detected)')
+    parser.add_argument('-r', '--range', nargs=2, type=float, required=True, metavar=('XMIN', 'XMAX'), help='fitting range')
+    parser.add_argument('-o', '--output', default='-', help='output CSV file (default: stdout)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--energy', action='store_true', help='convert x from wavelength [nm] to energy [eV] before fitting')
+    parser.add_argument('--sequential', action='store_true', help='use the result of each file as the initial guess for the next')
+    parser.add_argument('--shared', nargs='+', choices=('center', 'intensity', 'width'), default=None,
+                        help='fit all spectra at once with these peak parameters shared between them')
+    parser.add_argument('--baseline', nargs='+', default=None, metavar=('METHOD', 'PARAM'),
+                        help=f'subtract a baseline before fitting; METHOD is one of {", ".join(baseline_methods)}, '
+                             'optional PARAM is lambda (ALS), degree (Polynomial) or radius in points (RollingBall)')
+    parser.add_argument('--log', default=None, help='append per-fit telemetry to this JSON Lines file')
+    args = parser.parse_args()
+
+    filenames = find_files(args.patterns)
+    if len(filenames) == 0:
+        print('No files matched.', file=sys.stderr)
+        return 1
+    params = read_params(args.params) if args.params is not None else None
+    xlim = list(args.range)
+
+    shared = get_shared_indices(args.shared, args.function) if args.shared is not None else None
+    baseline = None
+    if args.baseline is not None:
+        try:
+            if args.baseline[0] not in baseline_methods or len(args.baseline) > 2:
+                raise ValueError
+            baseline = (args.baseline[0], float(args.baseline[1]) if len(args.baseline) == 2 else None)
+        except ValueError:
+            parser.error(f'--baseline: expected METHOD [PARAM] with METHOD in {", ".join(baseline_methods)}')
+    results = fit_files(filenames, args.function, params, xlim, args.energy, args.sequential, args.workers, args.num_peaks,
+                        shared, baseline)
+
+    if args.output == '-':
+        write_results(results, sys.stdout, args.function, params, xlim)
+    else:
+        with open(args.output, 'w', newline='') as f:
+            write_results(results, f, args.function, params, xlim)
+
+    if args.log is not None:
+        stats = {name: stats for name, _, _, stats in results if stats is not None}
+        write_fit_log(stats, args.function, xlim, args.log)
+
+    num_failed = sum(1 for _, params_fit, _, _ in results if params_fit is None)
+    print(f'{len(results) - num_failed}/{len(results)} spectra fitted.', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def first_in_segment(mask: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # 各区間（starts[i]から次の区間の手前まで）でmaskがTrueになる最初のインデックス
+    nonzero = np.flatnonzero(mask)
+    if len(nonzero) == 0:
+        return starts
+    pos = np.minimum(np.searchsorted(nonzero, starts), len(nonzero) - 1)
+    index = nonzero[pos]
+    # NaNなどで見つからなかった区間は区間の先頭で代用する
+    ends = np.append(starts[1:], len(mask))
+    return np.where(index < ends, index, starts)
+
+
+def decimate_minmax(x: np.ndarray, y: np.ndarray, xlim: tuple, num_columns: int) -> (np.ndarray, np.ndarray):
+    # 表示範囲を横方向にnum_columns個の列（ピクセル）に分け，各列の最初・最後・最小・最大の点だけを残す
+    # 線で結んだときの見た目は元のデータと変わらず，ピークの極値も失われない
+    # xは単調（昇順または降順）であること
+    if num_columns <= 0 or len(x) <= 4 * num_columns:
+        return x, y
+    if x[0] > x[-1]:
+        x = x[::-1]
+        y = y[::-1]
+
+    # 表示範囲の外側の1点ずつも残して，線が端まで届くようにする
+    xmin, xmax = sorted(xlim)
+    start = max(np.searchsorted(x, xmin, side='left') - 1, 0)
+    stop = min(np.searchsorted(x, xmax, side='right') + 1, len(x))
+    x = x[start:stop]
+    y = y[start:stop]
+    if len(x) <= 4 * num_columns:
+        return x, y
+
+    edges = np.linspace(xmin, xmax, num_columns + 1)[1:-1]
+    starts = np.unique(np.concatenate([[0], np.searchsorted(x, edges)]))
+    starts = starts[starts < len(x)]
+    lengths = np.diff(np.append(starts, len(x)))
+    ends = starts + lengths - 1
+
+    y_min = np.minimum.reduceat(y, starts)
+    y_max = np.maximum.reduceat(y, starts)
+    i_min = first_in_segment(y == np.repeat(y_min, lengths), starts)
+    i_max = first_in_segment(y == np.repeat(y_max, lengths), starts)
+
+    index = np.unique(np.concatenate([starts, ends, i_min, i_max]))
+    return x[index], y[index]
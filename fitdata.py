@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class FitData:
+    # 全スペクトルを結合してxでソートした配列をキャッシュする
+    # 同じデータで初期値だけ変えてフィッティングを繰り返すときに，結合とソートをやり直さない
+    # spec_dictの中身（ファイル・配列）や横軸の単位・ベースラインの設定が変わったら作り直す
+    def __init__(self):
+        self.sources = None
+        self.x_mode = None
+        self.x = None
+        self.y = None
+
+    def is_valid(self, spec_dict: dict, x_mode) -> bool:
+        if self.sources is None or x_mode != self.x_mode or len(spec_dict) != len(self.sources):
+            return False
+        for (filename, spec), (filename_cached, xdata, ydata) in zip(spec_dict.items(), self.sources):
+            if filename != filename_cached or spec.xdata is not xdata or spec.ydata is not ydata:
+                return False
+        return True
+
+    def get(self, spec_dict: dict, x_mode, get_xdata, get_ydata=None) -> (np.ndarray, np.ndarray):
+        # x_mode: 横軸の単位（と励起波長，ベースラインの設定）．比較できるものなら何でもよい
+        # get_xdata: ファイル名から表示単位のxを返す関数
+        # get_ydata: ファイル名からベースラインを差し引いたyなどを返す関数．Noneならspec.ydata
+        if not self.is_valid(spec_dict, x_mode):
+            x = np.concatenate([get_xdata(filename) for filename in spec_dict])
+            if get_ydata is None:
+                y = np.concatenate([np.asarray(spec.ydata) for spec in spec_dict.values()])
+            else:
+                y = np.concatenate([np.asarray(get_ydata(filename)) for filename in spec_dict])
+            order = np.argsort(x, kind='stable')
+            self.x = x[order]
+            self.y = y[order]
+            self.sources = [(filename, spec.xdata, spec.ydata) for filename, spec in spec_dict.items()]
+            self.x_mode = x_mode
+        return self.x, self.y
+
+    def invalidate(self) -> None:
+        self.sources = None
+        self.x = None
+        self.y = None
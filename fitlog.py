@@ -0,0 +1,46 @@
+import datetime
+import json
+import os
+import statistics
+
+# フィッティングの記録（時間・評価回数・収束の様子）をJSON Linesで保存し，要約を作る
+
+LOG_PATH = os.path.join(os.path.expanduser('~'), '.pgraph', 'fit_log.jsonl')
+
+
+def write_fit_log(stats_dict: dict, function: str, xlim: list, path: str = LOG_PATH) -> None:
+    # stats_dict: {filename: Fit.stats}
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    timestamp = datetime.datetime.now().isoformat(timespec='seconds')
+    with open(path, 'a') as f:
+        for filename, stats in stats_dict.items():
+            record = {'timestamp': timestamp, 'source': filename, 'function': function, 'range': list(xlim)}
+            record.update(stats)
+            f.write(json.dumps(record) + '\n')
+
+
+def format_stats(stats: dict) -> str:
+    # 1回のフィッティングの要約
+    if stats is None:
+        return ''
+    text = f'{stats["time"]:.3f} s, {stats["num_points"]}点'
+    if stats['success']:
+        text += f', 評価{stats["nfev"]}回, 反復{stats["iterations"]}回, 残差{stats["residual_norm"]:.3g}, cond {stats["cond"]:.3g}'
+    else:
+        text += ', 失敗'
+    return text
+
+
+def summarize_stats(stats_dict: dict) -> str:
+    # 複数のフィッティングの要約
+    if len(stats_dict) == 0:
+        return ''
+    times = [stats['time'] for stats in stats_dict.values()]
+    num_success = sum(1 for stats in stats_dict.values() if stats['success'])
+    nfevs = [stats['nfev'] for stats in stats_dict.values() if stats['nfev'] is not None]
+    slowest = max(stats_dict, key=lambda filename: stats_dict[filename]['time'])
+    text = f'{len(stats_dict)}本中{num_success}本成功, 合計{sum(times):.2f} s, 中央値{statistics.median(times):.3f} s'
+    if len(nfevs) > 0:
+        text += f', 評価回数の中央値{statistics.median(nfevs):g}回'
+    text += f'\n最も遅い: {os.path.basename(str(slowest))} ({stats_dict[slowest]["time"]:.3f} s)'
+    return text
@@ -1,8 +1,13 @@
-from scipy.optimize import curve_fit
-from scipy.special import wofz
+from concurrent.futures import ProcessPoolExecutor
+import os
+import threading
+import time
+from typing import Optional, TYPE_CHECKING
 import numpy as np
-import matplotlib.cm as cm
-import matplotlib.pyplot as plt
+
+# scipyとmatplotlibは読み込みに時間がかかるので，使うときに読み込む（起動・ワーカープロセスの立ち上げを速くする）
+if TYPE_CHECKING:
+    from matplotlib.axes import Axes
 
 
 def Lorentzian(x: np.ndarray, center: float, intensity: float, w: float) -> np.ndarray:
@@ -18,19 +23,136 @@ def Gaussian(x: np.ndarray, center: float, intensity: float, sigma: float) -> np
 def Voigt(x: np.ndarray, center: float, intensity: float, lw: float, gw: float) -> np.ndarray:
     # lw : HWFM of Lorentzian
     # gw : sigma of Gaussian
-    if gw == 0:
-        gw = 1e-10
+    # パラメータに(num_func, 1)の配列を渡すと全ピークをまとめて計算できる
+    # ピークの高さはcenterでの値 Re[w(i lw / (gw sqrt(2)))] = erfcx(lw / (gw sqrt(2))) で規格化する
+    # （グリッドの最大値で割ると，データ点の細かさで高さが変わり，微分も滑らかでなくなる）
+    from scipy.special import wofz, erfcx
+
+    # 幅は絶対値で使う（最適化の途中で負になっても同じ形のピークになる）
+    gw = np.maximum(np.abs(gw), 1e-10)
+    lw = np.abs(lw)
     z = (x - center + 1j*lw) / (gw * np.sqrt(2.0))
     w = wofz(z)
-    model_y = w.real / (gw * np.sqrt(2.0*np.pi))
-    intensity /= model_y.max()
-    return intensity * model_y
+    return intensity * w.real / erfcx(lw / (gw * np.sqrt(2.0)))
+
+
+# TCH (Thompson-Cox-Hastings) の擬Voigt関数の係数
+TCH_WIDTH = (1.0, 2.69269, 2.42843, 4.47163, 0.07842, 1.0)
+TCH_ETA = (1.36603, -0.47719, 0.11116)
+
+
+def PseudoVoigt(x: np.ndarray, center: float, intensity: float, lw: float, gw: float) -> np.ndarray:
+    # Voigtの高速な近似（TCHの擬Voigt関数）．パラメータの意味はVoigtと同じ
+    # 同じ幅のLorentzianとGaussianの重ね合わせなのでwofzを使わない
+    # ピーク高さで規格化したVoigtとの差は，ピーク高さの1.6%未満（lwとgwの全ての比で確認）
+    f, eta = pseudo_voigt_width(lw, gw)
+    d2 = (x - center) ** 2 / f ** 2
+    y = eta / (1 + 4 * d2) + (1 - eta) * np.exp(-4 * np.log(2) * d2)
+    return intensity * y
+
+
+def pseudo_voigt_width(lw: float, gw: float) -> (float, float):
+    # 擬Voigt関数の半値全幅fと，Lorentzianの割合eta
+    f_g = 2 * np.sqrt(2 * np.log(2)) * np.abs(gw)
+    f_l = 2 * np.abs(lw)
+    f = sum(c * f_g ** (5 - i) * f_l ** i for i, c in enumerate(TCH_WIDTH)) ** (1 / 5)
+    f = np.maximum(f, 1e-10)
+    r = f_l / f
+    eta = sum(c * r ** (i + 1) for i, c in enumerate(TCH_ETA))
+    return f, eta
 
 
 def linear(x: np.ndarray, a: float, b: float) -> np.ndarray:
     return a * x + b
 
 
+# 各関数のパラメータに関する偏微分（解析的ヤコビアン）
+# 戻り値の形は (len(x), パラメータ数)
+# パラメータに(num_func, 1)の配列を渡すと (num_func, len(x), パラメータ数) になる
+def Lorentzian_jac(x: np.ndarray, center: float, intensity: float, w: float) -> np.ndarray:
+    dx = x - center
+    denom = 4 * dx ** 2 + w ** 2
+    d_intensity = w ** 2 / denom
+    d_center = intensity * 8 * w ** 2 * dx / denom ** 2
+    d_w = intensity * 8 * w * dx ** 2 / denom ** 2
+    return np.stack([d_center, d_intensity, d_w], axis=-1)
+
+
+def Gaussian_jac(x: np.ndarray, center: float, intensity: float, sigma: float) -> np.ndarray:
+    dx = x - center
+    d_intensity = np.exp(-1 / 2 * dx ** 2 / sigma ** 2)
+    d_center = intensity * d_intensity * dx / sigma ** 2
+    d_sigma = intensity * d_intensity * dx ** 2 / sigma ** 3
+    return np.stack([d_center, d_intensity, d_sigma], axis=-1)
+
+
+def Voigt_jac(x: np.ndarray, center: float, intensity: float, lw: float, gw: float) -> np.ndarray:
+    # f = intensity * u / N,  u = Re[w(z)],  N = erfcx(y0),  y0 = |lw| / (gw sqrt(2))
+    # w(z)の微分は w'(z) = -2 z w(z) + 2i / sqrt(pi)，erfcxの微分は 2 y erfcx(y) - 2 / sqrt(pi)
+    from scipy.special import wofz, erfcx
+
+    sign_lw = np.where(lw < 0, -1.0, 1.0)
+    sign_gw = np.where(gw < 0, -1.0, 1.0)
+    gw = np.maximum(np.abs(gw), 1e-10)
+    lw = np.abs(lw)
+    z = (x - center + 1j*lw) / (gw * np.sqrt(2.0))
+    w = wofz(z)
+    dw = -2 * z * w + 2j / np.sqrt(np.pi)
+    y0 = lw / (gw * np.sqrt(2.0))
+    norm = erfcx(y0)
+    d_norm = 2 * y0 * norm - 2 / np.sqrt(np.pi)
+
+    u = w.real
+    d_intensity = u / norm
+    # z, y0の各パラメータに関する微分
+    d_center = intensity * (dw * (-1 / (gw * np.sqrt(2.0)))).real / norm
+    dz_lw = 1j * sign_lw / (gw * np.sqrt(2.0))
+    dy0_lw = sign_lw / (gw * np.sqrt(2.0))
+    d_lw = intensity * ((dw * dz_lw).real * norm - u * d_norm * dy0_lw) / norm ** 2
+    dz_gw = -z / gw
+    dy0_gw = -y0 / gw
+    d_gw = intensity * ((dw * dz_gw).real * norm - u * d_norm * dy0_gw) / norm ** 2 * sign_gw
+    return np.stack([d_center, d_intensity, d_lw, d_gw], axis=-1)
+
+
+def PseudoVoigt_jac(x: np.ndarray, center: float, intensity: float, lw: float, gw: float) -> np.ndarray:
+    # 幅fと割合etaを通してlw, gwに依存する
+    f_g = 2 * np.sqrt(2 * np.log(2)) * np.abs(gw)
+    f_l = 2 * np.abs(lw)
+    f, eta = pseudo_voigt_width(lw, gw)
+    s = f ** 5
+    ds_fg = sum(c * (5 - i) * f_g ** (4 - i) * f_l ** i for i, c in enumerate(TCH_WIDTH) if i < 5)
+    ds_fl = sum(c * i * f_g ** (5 - i) * f_l ** (i - 1) for i, c in enumerate(TCH_WIDTH) if i > 0)
+    df_fg = ds_fg / (5 * s ** (4 / 5))
+    df_fl = ds_fl / (5 * s ** (4 / 5))
+    r = f_l / f
+    deta_r = sum(c * (i + 1) * r ** i for i, c in enumerate(TCH_ETA))
+    deta_fg = deta_r * (-f_l / f ** 2 * df_fg)
+    deta_fl = deta_r * (1 / f - f_l / f ** 2 * df_fl)
+    dfg_gw = 2 * np.sqrt(2 * np.log(2)) * np.where(gw < 0, -1.0, 1.0)
+    dfl_lw = 2 * np.where(lw < 0, -1.0, 1.0)
+
+    dx = x - center
+    lor = 1 / (1 + 4 * dx ** 2 / f ** 2)
+    gau = np.exp(-4 * np.log(2) * dx ** 2 / f ** 2)
+    d_intensity = eta * lor + (1 - eta) * gau
+    d_center = intensity * (eta * lor ** 2 * 8 * dx / f ** 2 + (1 - eta) * gau * 8 * np.log(2) * dx / f ** 2)
+    dy_f = eta * lor ** 2 * 8 * dx ** 2 / f ** 3 + (1 - eta) * gau * 8 * np.log(2) * dx ** 2 / f ** 3
+    dy_eta = lor - gau
+    d_lw = intensity * (dy_f * df_fl + dy_eta * deta_fl) * dfl_lw
+    d_gw = intensity * (dy_f * df_fg + dy_eta * deta_fg) * dfg_gw
+    return np.stack([d_center, d_intensity, d_lw, d_gw], axis=-1)
+
+
+def linear_jac(x: np.ndarray, a: float, b: float) -> np.ndarray:
+    return np.stack([x, np.ones_like(x)], axis=-1)
+
+
+class FitCancelled(Exception):
+    # cancel_eventがセットされたときにフィッティングを中断するための例外
+    pass
+
+
 class Fit:
     def __init__(self):
         self.x = None
@@ -39,19 +161,32 @@ class Fit:
         self.params = None
         self.num_func = 0
         self.func = Lorentzian
+        self.func_jac = Lorentzian_jac
         self.num_params_per_func = 3
 
         self.y_sum = None
+        self.jac = None
         self.y_list = []
 
         self.params_fit = None
         self.pcov = None
+        self.stats = None
 
-    def set_data(self, x: np.ndarray, y: np.ndarray, xlim: np.ndarray) -> None:
+        # 別スレッドからセットされると，次のモデル評価でFitCancelledを送出する
+        self.cancel_event: Optional[threading.Event] = None
+
+    def set_data(self, x: np.ndarray, y: np.ndarray, xlim: np.ndarray, is_sorted: bool = False) -> None:
         self.xlim = xlim
-        fit_range = (xlim[0] <= x) & (x <= xlim[1])
-        x = x[fit_range]
-        y = y[fit_range]
+        if is_sorted:
+            # xが昇順ならスライスで切り出せる（コピーしない）
+            start = np.searchsorted(x, xlim[0], side='left')
+            stop = np.searchsorted(x, xlim[1], side='right')
+            x = x[start:stop]
+            y = y[start:stop]
+        else:
+            fit_range = (xlim[0] <= x) & (x <= xlim[1])
+            x = x[fit_range]
+            y = y[fit_range]
 
         self.x = x
         self.y = y
@@ -59,12 +194,19 @@ class Fit:
     def set_function(self, name: str) -> None:
         if name == 'Lorentzian':
             self.func = Lorentzian
+            self.func_jac = Lorentzian_jac
             self.num_params_per_func = 3
         elif name == 'Gaussian':
             self.func = Gaussian
+            self.func_jac = Gaussian_jac
             self.num_params_per_func = 3
         elif name == 'Voigt':
             self.func = Voigt
+            self.func_jac = Voigt_jac
+            self.num_params_per_func = 4
+        elif name == 'PseudoVoigt':
+            self.func = PseudoVoigt
+            self.func_jac = PseudoVoigt_jac
             self.num_params_per_func = 4
         else:
             raise ValueError(f'Unsupported function name: {name}')
@@ -73,26 +215,82 @@ class Fit:
         self.params = params
         self.num_func = int(len(self.params) / self.num_params_per_func)
 
+    def split_params(self, params) -> list:
+        # ピークのパラメータを(num_func, num_params_per_func)に並べ替え，
+        # 各パラメータを(num_func, 1)の列として返す．xとブロードキャストして全ピークを一度に計算できる
+        num = self.num_func * self.num_params_per_func
+        peaks = np.asarray(params[:num], dtype=float).reshape(self.num_func, self.num_params_per_func)
+        return list(peaks.T[:, :, np.newaxis])
+
+    def check_cancelled(self) -> None:
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise FitCancelled()
+
     def superposition(self, x: np.ndarray, *params) -> np.ndarray:
+        self.check_cancelled()
+        # curve_fitから何度も呼ばれるので出力用の配列は使い回す
+        if self.y_sum is None or self.y_sum.shape != x.shape:
+            self.y_sum = np.empty(x.shape)
+
         # 全てのyを足し合わせ
-        self.y_sum = np.zeros_like(x)
-        for i in range(self.num_func):
-            p = params[i * self.num_params_per_func:(i + 1) * self.num_params_per_func]
-            self.y_sum += self.func(x, *p)
+        y_peaks = self.func(x, *self.split_params(params))
+        np.sum(y_peaks, axis=0, out=self.y_sum)
 
         # バックグラウンドを追加
         self.y_sum += linear(x, params[-2], params[-1])
 
         return self.y_sum
 
+    def jacobian(self, x: np.ndarray, *params) -> np.ndarray:
+        # superpositionのヤコビアン．数値微分をさせないためにcurve_fitに渡す
+        self.check_cancelled()
+        if self.jac is None or self.jac.shape != (len(x), len(params)):
+            self.jac = np.zeros((len(x), len(params)))
+
+        num = self.num_func * self.num_params_per_func
+        jac_peaks = self.func_jac(x, *self.split_params(params))
+        self.jac[:, :num] = jac_peaks.transpose(1, 0, 2).reshape(len(x), num)
+
+        # バックグラウンド
+        self.jac[:, -2:] = linear_jac(x, params[-2], params[-1])
+
+        return self.jac
+
     def fit(self) -> bool:
+        from scipy.optimize import curve_fit
+
         if self.params is None:
             return False
+        # 時間・評価回数・収束の様子を記録する
+        self.stats = {
+            'success': False,
+            'time': 0.0,
+            'nfev': None,  # モデルの評価回数
+            'iterations': None,  # ヤコビアンの評価回数（反復回数に相当）
+            'residual_norm': None,
+            'cond': None,  # pcovの条件数
+            'num_points': 0 if self.x is None else len(self.x),
+            'message': '',
+        }
+        start = time.perf_counter()
         try:
-            self.params_fit, self.pcov = curve_fit(self.superposition, self.x, self.y, p0=self.params)
-        except RuntimeError:
+            self.params_fit, self.pcov, infodict, message, _ = curve_fit(
+                self.superposition, self.x, self.y, p0=self.params, jac=self.jacobian, full_output=True)
+        except RuntimeError as e:
+            self.stats['message'] = str(e)
             return False
+        except FitCancelled:
+            self.stats['message'] = 'cancelled'
+            raise
+        finally:
+            self.stats['time'] = time.perf_counter() - start
 
+        self.stats['success'] = True
+        self.stats['nfev'] = int(infodict['nfev'])
+        self.stats['iterations'] = int(infodict.get('njev', 0))
+        self.stats['residual_norm'] = float(np.linalg.norm(infodict['fvec']))
+        self.stats['cond'] = float(np.linalg.cond(self.pcov)) if np.all(np.isfinite(self.pcov)) else float('inf')
+        self.stats['message'] = message
         return True
 
     def make_y_list(self) -> bool:
@@ -100,18 +298,18 @@ class Fit:
             return False
 
         self.y_list = []
-        self.y_list.append(self.superposition(self.x, *self.params_fit))
-        for i in range(self.num_func):
-            p = self.params_fit[i * self.num_params_per_func:(i + 1) * self.num_params_per_func]
-            y = self.func(self.x, *p)
-            self.y_list.append(y)
+        # superpositionの戻り値は使い回されるのでコピーしておく
+        self.y_list.append(self.superposition(self.x, *self.params_fit).copy())
+        self.y_list.extend(self.func(self.x, *self.split_params(self.params_fit)))
 
         # バックグラウンドを追加
         self.y_list.append(linear(self.x, self.params_fit[-2], self.params_fit[-1]))
 
         return True
 
-    def draw(self, ax: plt.axes) -> list:
+    def draw(self, ax: 'Axes') -> list:
+        import matplotlib.cm as cm
+
         ok = self.make_y_list()
         if not ok:
             return []
@@ -127,3 +325,197 @@ class Fit:
 
         return fitting_result
 
+
+def fit_spectrum(x: np.ndarray, y: np.ndarray, xlim: list, function: str, params: list) -> Optional[np.ndarray]:
+    return fit_spectrum_with_stats(x, y, xlim, function, params)[0]
+
+
+def fit_spectrum_with_stats(x: np.ndarray, y: np.ndarray, xlim: list, function: str, params: list,
+                            cancel_event: threading.Event = None) -> (Optional[np.ndarray], dict):
+    # 1本のスペクトルをフィッティングし，結果とFit.statsを返す．プロセスプールから呼ぶのでトップレベルに置く
+    fitter = Fit()
+    fitter.set_function(function)
+    fitter.set_data(x, y, xlim)
+    fitter.set_params(params)
+    fitter.cancel_event = cancel_event
+    try:
+        ok = fitter.fit()
+    except (ValueError, TypeError) as e:  # 範囲内のデータ点がパラメータ数より少ない場合など
+        fitter.stats['message'] = str(e)
+        return None, fitter.stats
+    if not ok or not np.all(np.isfinite(fitter.params_fit)):
+        fitter.stats['success'] = False
+        return None, fitter.stats
+    return fitter.params_fit, fitter.stats
+
+
+def is_diverged(params_fit: np.ndarray, xlim: list, function: str) -> bool:
+    # 結果が得られない，またはピーク位置がフィッティング範囲の外に出てしまった場合は発散とみなす
+    if params_fit is None:
+        return True
+    fitter = Fit()
+    fitter.set_function(function)
+    fitter.set_params(params_fit)
+    centers = fitter.split_params(params_fit)[0]
+    return bool(np.any((centers < min(xlim)) | (max(xlim) < centers)))
+
+
+def fit_spectra(data: dict, xlim: list, function: str, params: list, max_workers: int = None, stats: dict = None,
+                cancel_event: threading.Event = None, progress=None) -> dict:
+    # data: {filename: (x, y)} の各スペクトルを同じモデル・初期値で独立にフィッティングする
+    # 戻り値: {filename: params_fit}．失敗したスペクトルはNone
+    # statsにdictを渡すと{filename: Fit.stats}を書き込む
+    # progressは1本終わるごとにfilenameを引数にして呼ばれる
+    # cancel_eventはワーカープロセスには渡せないので，結果を受け取るたびに確認して残りを取り消す
+    if len(data) == 0:
+        return {}
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    max_workers = min(max_workers, len(data))
+    # プロセス間通信の回数を減らすため，ある程度まとめてワーカーに渡す
+    chunksize = max(1, len(data) // (max_workers * 4))
+
+    filenames = list(data.keys())
+    xs = [data[filename][0] for filename in filenames]
+    ys = [data[filename][1] for filename in filenames]
+    n = len(filenames)
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(fit_spectrum_with_stats, xs, ys, [xlim] * n, [function] * n, [params] * n, chunksize=chunksize)
+        params_fit = {}
+        for filename, (p, s) in zip(filenames, results):
+            params_fit[filename] = p
+            if stats is not None:
+                stats[filename] = s
+            if progress is not None:
+                progress(filename)
+            if cancel_event is not None and cancel_event.is_set():
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise FitCancelled()
+        return params_fit
+
+
+def fit_spectra_sequential(data: dict, xlim: list, function: str, params: list, stats: dict = None,
+                           cancel_event: threading.Event = None, progress=None) -> dict:
+    # data: {filename: (x, y)} をdictの順番にフィッティングし，前のスペクトルの結果を次の初期値に使う
+    # 発散した場合は元の初期値でやり直す
+    # 戻り値: {filename: params_fit}．失敗したスペクトルはNone
+    # statsにdictを渡すと{filename: Fit.stats}を書き込む（やり直した場合は'retried'がTrue）
+    # progressは1本終わるごとにfilenameを引数にして呼ばれる
+    results = {}
+    p0 = params
+    for filename, (x, y) in data.items():
+        params_fit, s = fit_spectrum_with_stats(x, y, xlim, function, p0, cancel_event)
+        s['retried'] = False
+        if is_diverged(params_fit, xlim, function) and p0 is not params:
+            params_fit, s = fit_spectrum_with_stats(x, y, xlim, function, params, cancel_event)
+            s['retried'] = True
+        if stats is not None:
+            stats[filename] = s
+        if progress is not None:
+            progress(filename)
+        if is_diverged(params_fit, xlim, function):
+            results[filename] = None
+            continue
+        results[filename] = params_fit
+        p0 = params_fit.tolist()
+    return results
+
+
+# グローバルフィットでpcovの条件数を計算するパラメータ数の上限（密行列になるため）
+MAX_PARAMS_COND = 1000
+
+
+def fit_spectra_global(data: dict, xlim: list, function: str, params: list, shared: list, stats: dict = None,
+                       cancel_event: threading.Event = None) -> dict:
+    # data: {filename: (x, y)} を同時にフィッティングする
+    # shared: 全スペクトルで共通にするピークのパラメータの番号（0: 位置, 1: 強度, 2以降: 幅）
+    # それ以外のパラメータとバックグラウンドはスペクトルごと
+    # ヤコビアンは共通パラメータの列と各スペクトルの対角ブロックだけからなる疎行列になるので，
+    # 疎行列のままleast_squares（trf, lsmr）で解く．計算量はスペクトル数にほぼ比例する
+    # 戻り値: {filename: params_fit}．失敗したスペクトルはNone
+    # statsにdictを渡すと{'global': Fit.statsと同じ形式}を書き込む
+    from scipy.optimize import least_squares
+    from scipy.sparse import csr_matrix
+
+    if len(data) == 0:
+        return {}
+    filenames = list(data.keys())
+    fitters = []
+    for filename in filenames:
+        fitter = Fit()
+        fitter.set_function(function)
+        fitter.set_data(np.asarray(data[filename][0]), np.asarray(data[filename][1]), xlim)
+        fitter.set_params(params)
+        fitter.cancel_event = cancel_event
+        fitters.append(fitter)
+    num_func = fitters[0].num_func
+    num_params_per_func = fitters[0].num_params_per_func
+    num_params = num_func * num_params_per_func + 2
+
+    # 各スペクトルのパラメータが全体のパラメータベクトルのどこに対応するか
+    is_shared = np.zeros(num_params, dtype=bool)
+    for i in range(num_func):
+        is_shared[[i * num_params_per_func + j for j in shared]] = True
+    shared_cols = np.flatnonzero(is_shared)
+    local_cols = np.flatnonzero(~is_shared)
+    num_shared = len(shared_cols)
+    num_local = len(local_cols)
+    colmaps = np.empty((len(fitters), num_params), dtype=int)
+    colmaps[:, shared_cols] = np.arange(num_shared)
+    colmaps[:, local_cols] = num_shared + np.arange(len(fitters))[:, np.newaxis] * num_local + np.arange(num_local)
+
+    params = np.asarray(params, dtype=float)
+    z0 = np.concatenate([params[shared_cols], np.tile(params[local_cols], len(fitters))])
+
+    # 疎行列の構造は変わらないので先に作っておく（1行にnum_params個の非ゼロ要素）
+    num_points = sum(len(fitter.x) for fitter in fitters)
+    indices = np.concatenate([np.tile(colmap, len(fitter.x)) for fitter, colmap in zip(fitters, colmaps)])
+    indptr = np.arange(0, num_points * num_params + 1, num_params)
+
+    def residual(z: np.ndarray) -> np.ndarray:
+        p = z[colmaps]
+        return np.concatenate([fitter.superposition(fitter.x, *p[i]) - fitter.y for i, fitter in enumerate(fitters)])
+
+    def jacobian(z: np.ndarray):
+        p = z[colmaps]
+        values = np.concatenate([fitter.jacobian(fitter.x, *p[i]).ravel() for i, fitter in enumerate(fitters)])
+        return csr_matrix((values, indices, indptr), shape=(num_points, len(z)))
+
+    s = {
+        'success': False,
+        'time': 0.0,
+        'nfev': None,
+        'iterations': None,
+        'residual_norm': None,
+        'cond': None,
+        'num_points': num_points,
+        'message': '',
+    }
+    if stats is not None:
+        stats['global'] = s
+    start = time.perf_counter()
+    try:
+        result = least_squares(residual, z0, jac=jacobian, method='trf', tr_solver='lsmr', x_scale='jac')
+    except ValueError as e:  # データ点がパラメータ数より少ない場合など
+        s['message'] = str(e)
+        return {filename: None for filename in filenames}
+    finally:
+        s['time'] = time.perf_counter() - start
+
+    s['nfev'] = int(result.nfev)
+    s['iterations'] = int(result.njev) if result.njev is not None else None
+    s['residual_norm'] = float(np.linalg.norm(result.fun))
+    s['message'] = result.message
+    if not result.success or not np.all(np.isfinite(result.x)):
+        return {filename: None for filename in filenames}
+    s['success'] = True
+    if len(result.x) <= MAX_PARAMS_COND:
+        jtj = (result.jac.T @ result.jac).toarray()
+        s['cond'] = float(np.linalg.cond(jtj))
+    else:
+        s['cond'] = float('nan')
+
+    results = {}
+    for filename, p in zip(filenames, result.x[colmaps]):
+        results[filename] = None if is_diverged(p, xlim, function) else p
+    return results
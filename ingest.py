@@ -0,0 +1,76 @@
+from concurrent.futures import ThreadPoolExecutor
+from speccache import SpecCache
+
+
+def load_file(filename: str, cache: SpecCache = None) -> dict:
+    # 1ファイルを読み込む．DataLoaderはスレッドセーフではないので，スレッドごとに別のものを使う
+    if cache is not None:
+        cached = cache.get(filename)
+        if cached is not None:
+            name, spec = cached
+            return {name: spec}
+
+    from dataloader import DataLoader  # pandasを読み込むので使うときに
+
+    dl = DataLoader()
+    dl.load_files([filename])
+    if cache is not None and len(dl.spec_dict) == 1:
+        name, spec = next(iter(dl.spec_dict.items()))
+        # キャッシュは速くするためだけのものなので，書き込めなくても（容量不足・書き込み禁止など）読み込みは成功とする
+        try:
+            cache.put(filename, name, spec)
+        except OSError:
+            pass
+    return dl.spec_dict
+
+
+class AsyncLoader:
+    # ファイルの読み込みをスレッドプールで行い，読み込めたものから順に受け取る
+    # 読み込み結果のオブジェクトをそのまま受け渡したいので，プロセスではなくスレッドを使う
+    def __init__(self, max_workers: int = None, cache: SpecCache = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.cache = cache
+        self.filenames = []
+        self.futures = []
+        self.num_received = 0
+        self.errors = {}
+
+    @property
+    def num_total(self) -> int:
+        return len(self.futures)
+
+    @property
+    def num_done(self) -> int:
+        return self.num_received
+
+    def add(self, filenames: list) -> None:
+        for filename in filenames:
+            self.filenames.append(filename)
+            self.futures.append(self.executor.submit(load_file, filename, self.cache))
+
+    def poll(self) -> dict:
+        # 読み込みが終わったものを，渡された順番を保って返す（待たない）
+        spec_dict = {}
+        while self.num_received < len(self.futures) and self.futures[self.num_received].done():
+            future = self.futures[self.num_received]
+            filename = self.filenames[self.num_received]
+            self.num_received += 1
+            if future.cancelled():
+                continue
+            try:
+                spec_dict.update(future.result())
+            except Exception as e:  # 読み込めなかったファイルは最後にまとめて知らせる
+                self.errors[filename] = e
+        return spec_dict
+
+    def is_done(self) -> bool:
+        return self.num_received == len(self.futures)
+
+    def cancel(self) -> None:
+        # まだ受け取っていないものは全て破棄する．実行中のものは終わるまで待たない
+        for future in self.futures[self.num_received:]:
+            future.cancel()
+        self.num_received = len(self.futures)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
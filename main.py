@@ -1,4 +1,8 @@
+import importlib
 import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
@@ -9,8 +13,17 @@ import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from MyToolbar import MyToolbar
 from MyTreeview import MyTreeview
-from dataloader import DataLoader
-from fitting import Fit
+from decimation import decimate_minmax
+from ingest import AsyncLoader
+from speccache import SpecCache
+from specstore import SpecStore
+from fitdata import FitData
+from resultstore import ResultStore
+from xaxis import AxisCache, WAVELENGTH, ENERGY, RAMAN_SHIFT
+from baseline import METHODS as baseline_methods, DEFAULT_PARAMS as baseline_default_params
+from preprocess import PreprocessCache, NORMALIZE_MODES
+from fitlog import write_fit_log, format_stats, summarize_stats
+from fitting import Fit, FitCancelled, fit_spectra, fit_spectra_sequential, fit_spectra_global
 
 font_lg = ('Arial', 24)
 font_md = ('Arial', 16)
@@ -18,7 +31,11 @@ font_sm = ('Arial', 12)
 
 linestyles = ('solid', 'dashed', 'dashdot', 'dotted')
 
-functions = ('Lorentzian', 'Gaussian', "Voigt")
+functions = ('Lorentzian', 'Gaussian', "Voigt", 'PseudoVoigt')
+
+x_labels = ('Wavelength [nm]', 'Energy [eV]', 'Raman Shift [cm$^{-1}$]')
+x_units = (WAVELENGTH, ENERGY, RAMAN_SHIFT)  # x_labelsに対応する単位
+y_labels = ('Intensity [arb. units]', 'Counts', 'Absorbance', 'Transmittance')
 
 plt.rcParams['font.family'] = 'Arial'
 
@@ -82,22 +99,68 @@ class PGraph(tk.Frame):
         super().__init__(master)
         self.master = master
 
-        self.dl = DataLoader()
+        self.init_state()
+        self.create_graph()
+        self.create_config()
+
+        self.master.bind("<Return>", self.apply_option)
+        # ウィンドウが表示されたら，最初の読み込みで待たないように裏でdataloaderを読み込んでおく
+        self.after_idle(self.preload_modules)
+
+        # TODO: legend機能つける？
+
+    @property
+    def dl(self):
+        if self.data_loader is None:
+            from dataloader import DataLoader
+            self.data_loader = DataLoader()
+        return self.data_loader
+
+    def preload_modules(self) -> None:
+        threading.Thread(target=importlib.import_module, args=('dataloader',), daemon=True).start()
+
+    def init_state(self) -> None:
+        # ウィジェット以外の状態
+        # dataloaderはpandasを読み込むので起動時には作らない（dlを参照したときに作る）
+        self.data_loader = None
         self.fitter = Fit()
+        self.fit_data = FitData()
+        self.axis_cache = AxisCache()
+        # 前処理（スパイク除去・平滑化・ベースライン・規格化・リサンプル）したスペクトル
+        # パイプラインはpreprocess.pyのステップのタプル．空なら読み込んだまま
+        self.preprocess_cache = PreprocessCache()
+        self.pipeline = ()
 
         self.ax: plt.AxesSubplot
 
         self.spec_lines = {}
+        self.spec_line_states = {}
+        self.monotonic_cache = {}  # {id(x): (x, 単調かどうか)}
+        self.highlight_lines = {}
+        self.highlight_states = {}
         self.vlines = []
         self.hlines = []
         self.fitting_result = []
-
-        self.create_graph()
-        self.create_config()
-
-        self.master.bind("<Return>", self.apply_option)
-
-        # TODO: legend機能つける？
+        self.fitting_state = None
+        self.axes_state = None
+        self.background = None
+
+        self.loader = None
+        self.filename_check_device = None
+        # フィッティングは1つずつ別スレッドで行い，画面を止めない
+        self.fit_executor = ThreadPoolExecutor(max_workers=1)
+        self.fit_future = None
+        self.fit_callback = None
+        self.fit_cancel_event = threading.Event()
+        self.fit_num_done = 0
+        self.spec_store = SpecStore()
+        # キャッシュのフォルダの走査に時間がかかることがあるので，最初に読み込むときに開く
+        self.spec_cache = None
+        self.spec_cache_opened = False
+        try:
+            self.result_store = ResultStore()
+        except (OSError, sqlite3.Error):  # 使えない場合は従来通りファイルに追記する
+            self.result_store = None
 
     def create_graph(self) -> None:
         width = 900
@@ -116,6 +179,8 @@ class PGraph(tk.Frame):
         self.ax.set_yticks([])
         self.ax.set_xlabel('Energy [eV]')
         self.ax.set_ylabel('Intensity [arb. units]')
+        # ズームなどで表示範囲が変わったら間引き方を計算し直す
+        self.ax.callbacks.connect('xlim_changed', self.update_decimation)
 
     def create_config(self) -> None:
         # スタイル設定
@@ -140,6 +205,7 @@ class PGraph(tk.Frame):
 
         # graph
         self.canvas = FigureCanvasTkAgg(self.fig, master=frame_graph)
+        self.connect_canvas_events()
         frame_graph_setting = tk.LabelFrame(master=frame_graph, text='Graph Setting')
         toolbar = MyToolbar(self.canvas, frame_graph, pack_toolbar=False)
         self.canvas.get_tk_widget().grid(row=0, column=0)
@@ -164,33 +230,17 @@ class PGraph(tk.Frame):
         button_sort_descending.grid(row=2, column=2, padx=5, pady=5)
         button_reset_selection.grid(row=2, column=3, padx=5, pady=5)
         button_quit.grid(row=2, column=4, padx=5, pady=5)
-
-        # fitting
-        self.function_fitting = tk.StringVar(value=functions[0])
-        optionmenu_fitting = ttk.OptionMenu(frame_fitting, self.function_fitting, functions[0], *functions, command=self.function_changed)
-        optionmenu_fitting.config(width=10)
-        optionmenu_fitting['menu'].config(font=font_sm)
-        self.description_fitting = tk.StringVar(value='位置 強度 幅 (BG)')
-        self.description_fitting_fitted = tk.StringVar(value='(fitted) 位置 強度 幅 (BG)')
-        label_description_1 = ttk.Label(master=frame_fitting,  textvariable=self.description_fitting)
-        label_description_2 = ttk.Label(master=frame_fitting, textvariable=self.description_fitting_fitted)
-        self.text_params = tk.Text(master=frame_fitting, width=30, height=5, font=font_md)
-        self.text_params.insert(1.0, '1.7 20000 1\n1.8 3000 1\n0 0')
-        self.text_params_fit = tk.Text(master=frame_fitting, width=30, height=5, font=font_md)
-        self.button_fit = ttk.Button(master=frame_fitting, text='Fit', command=self.fit)
+        # 読み込みの進捗
+        self.progress_loading = ttk.Progressbar(master=frame_data, mode='determinate', length=600)
+        self.label_loading = ttk.Label(master=frame_data, text='')
+        self.button_cancel_loading = ttk.Button(master=frame_data, text='読込中止', state=tk.DISABLED, command=self.cancel_loading)
+        self.progress_loading.grid(row=1, column=0, columnspan=3, padx=5, pady=5)
+        self.label_loading.grid(row=1, column=3, padx=5, pady=5)
+        self.button_cancel_loading.grid(row=1, column=4, padx=5, pady=5)
+
+        # fitting（ウィンドウが表示されてから作る）
         self.if_show = tk.BooleanVar(value=False)
-        self.check_fit = ttk.Checkbutton(master=frame_fitting, variable=self.if_show, text='結果を描画', command=self.refresh)
-        button_load = ttk.Button(master=frame_fitting, text='LOAD', command=self.load_params)
-        button_save = ttk.Button(master=frame_fitting, text='SAVE', command=self.save_params)
-        optionmenu_fitting.grid(row=0, column=0, columnspan=4, padx=5, pady=5)
-        label_description_1.grid(row=1, column=0, columnspan=2)
-        label_description_2.grid(row=1, column=2, columnspan=2)
-        self.text_params.grid(row=2, column=0, columnspan=2)
-        self.text_params_fit.grid(row=2, column=2, columnspan=2)
-        self.button_fit.grid(row=3, column=0, padx=5, pady=5)
-        self.check_fit.grid(row=3, column=1, padx=5, pady=5)
-        button_load.grid(row=3, column=2, padx=5, pady=5)
-        button_save.grid(row=3, column=3, padx=5, pady=5)
+        self.after_idle(self.create_fitting_panel, frame_fitting)
 
         # labelframes in graph_setting
         frame_graph_setting_1 = ttk.Frame(master=frame_graph_setting)
@@ -219,8 +269,8 @@ class PGraph(tk.Frame):
         self.button_reset_lines.grid(row=2, column=0, padx=5, pady=5, sticky=tk.S)
 
         # xaxis, yaxis
-        self.x_labels = ('Wavelength [nm]', 'Energy [eV]', 'Raman Shift [cm$^{-1}$]')
-        self.y_labels = ('Intensity [arb. units]', 'Counts', 'Absorbance', 'Transmittance')
+        self.x_labels = x_labels
+        self.y_labels = y_labels
         self.x_label = tk.StringVar()
         optionmenu_x_label = ttk.OptionMenu(self.labelframe_label, self.x_label, self.x_labels[0], *self.x_labels, command=self.apply_option)
         optionmenu_x_label.config(width=16)
@@ -229,8 +279,16 @@ class PGraph(tk.Frame):
         optionmenu_y_label = ttk.OptionMenu(self.labelframe_label, self.y_label, self.y_labels[0], *self.y_labels, command=self.apply_option)
         optionmenu_y_label.config(width=16)
         optionmenu_y_label['menu'].config(font=font_sm)
+        # ラマンシフトに変換するための励起波長．空欄の場合は変換しない
+        self.laser_wavelength = tk.StringVar(value='')
+        frame_laser = ttk.Frame(master=self.labelframe_label)
+        label_laser = ttk.Label(master=frame_laser, text='励起波長 [nm]')
+        entry_laser = ttk.Entry(master=frame_laser, textvariable=self.laser_wavelength, font=font_md, width=6, justify=tk.CENTER)
         optionmenu_x_label.grid(row=0, column=0, padx=5, pady=5)
         optionmenu_y_label.grid(row=1, column=0, padx=5, pady=5)
+        frame_laser.grid(row=2, column=0, padx=5, pady=5)
+        label_laser.grid(row=0, column=0, padx=5)
+        entry_laser.grid(row=0, column=1, padx=5)
 
         # xaxis, yaxis label size
         label_x_label = ttk.Label(master=self.labelframe_labelsize, text='x軸')
@@ -329,10 +387,122 @@ class PGraph(tk.Frame):
         entry_hline_y.grid(row=2, column=1, padx=5, pady=5)
         button_hline_apply.grid(row=3, column=0, columnspan=2, padx=5, pady=5)
 
+    def create_fitting_panel(self, frame_fitting: tk.LabelFrame) -> None:
+        # 起動時にはなくてもよいので，最初の描画の後に作る
+        self.function_fitting = tk.StringVar(value=functions[0])
+        optionmenu_fitting = ttk.OptionMenu(frame_fitting, self.function_fitting, functions[0], *functions, command=self.function_changed)
+        optionmenu_fitting.config(width=10)
+        optionmenu_fitting['menu'].config(font=font_sm)
+        self.description_fitting = tk.StringVar(value='位置 強度 幅 (BG)')
+        self.description_fitting_fitted = tk.StringVar(value='(fitted) 位置 強度 幅 (BG)')
+        label_description_1 = ttk.Label(master=frame_fitting,  textvariable=self.description_fitting)
+        label_description_2 = ttk.Label(master=frame_fitting, textvariable=self.description_fitting_fitted)
+        self.text_params = tk.Text(master=frame_fitting, width=30, height=5, font=font_md)
+        self.text_params.insert(1.0, '1.7 20000 1\n1.8 3000 1\n0 0')
+        self.text_params_fit = tk.Text(master=frame_fitting, width=30, height=5, font=font_md)
+        self.button_fit = ttk.Button(master=frame_fitting, text='Fit', command=self.fit)
+        self.check_fit = ttk.Checkbutton(master=frame_fitting, variable=self.if_show, text='結果を描画', command=self.refresh)
+        button_load = ttk.Button(master=frame_fitting, text='LOAD', command=self.load_params)
+        button_save = ttk.Button(master=frame_fitting, text='SAVE', command=self.save_params)
+        button_fit_batch = ttk.Button(master=frame_fitting, text='個別Fit（全て）', command=self.fit_batch)
+        button_fit_sequential = ttk.Button(master=frame_fitting, text='連続Fit', command=self.fit_sequential)
+        button_estimate = ttk.Button(master=frame_fitting, text='初期値推定', command=self.estimate_params)
+        button_fit_global = ttk.Button(master=frame_fitting, text='グローバルFit', command=self.fit_global)
+        # グローバルFitで全スペクトル共通にするパラメータ
+        self.share_center = tk.BooleanVar(value=False)
+        self.share_width = tk.BooleanVar(value=True)
+        check_share_center = ttk.Checkbutton(master=frame_fitting, variable=self.share_center, text='位置を共通に')
+        check_share_width = ttk.Checkbutton(master=frame_fitting, variable=self.share_width, text='幅を共通に')
+        optionmenu_fitting.grid(row=0, column=0, columnspan=4, padx=5, pady=5)
+        label_description_1.grid(row=1, column=0, columnspan=2)
+        label_description_2.grid(row=1, column=2, columnspan=2)
+        self.text_params.grid(row=2, column=0, columnspan=2)
+        self.text_params_fit.grid(row=2, column=2, columnspan=2)
+        self.button_fit.grid(row=3, column=0, padx=5, pady=5)
+        self.check_fit.grid(row=3, column=1, padx=5, pady=5)
+        button_load.grid(row=3, column=2, padx=5, pady=5)
+        button_save.grid(row=3, column=3, padx=5, pady=5)
+        button_fit_batch.grid(row=4, column=0, padx=5, pady=5)
+        button_fit_sequential.grid(row=4, column=1, padx=5, pady=5)
+        button_estimate.grid(row=4, column=2, padx=5, pady=5)
+        button_fit_global.grid(row=5, column=0, padx=5, pady=5)
+        check_share_center.grid(row=5, column=1, padx=5, pady=5)
+        check_share_width.grid(row=5, column=2, padx=5, pady=5)
+        self.progress_fitting = ttk.Progressbar(master=frame_fitting, mode='determinate')
+        self.button_cancel_fitting = ttk.Button(master=frame_fitting, text='Fit中止', state=tk.DISABLED, command=self.cancel_fitting)
+        self.progress_fitting.grid(row=6, column=0, columnspan=3, padx=5, pady=5, sticky=tk.EW)
+        self.button_cancel_fitting.grid(row=6, column=3, padx=5, pady=5)
+        # 直前のフィッティングの時間・評価回数など
+        self.label_fit_stats = ttk.Label(master=frame_fitting, text='')
+        self.label_fit_stats.grid(row=7, column=0, columnspan=4, padx=5, pady=5, sticky=tk.W)
+        self.create_preprocess_panel(frame_fitting)
+
+    def create_preprocess_panel(self, frame_fitting: tk.LabelFrame) -> None:
+        # フィッティングの前に全スペクトルにかける前処理．チェックしたものを上から順にかける
+        labelframe_preprocess = tk.LabelFrame(master=frame_fitting, text='前処理')
+        self.if_despike = tk.BooleanVar(value=False)
+        self.despike_threshold = tk.StringVar(value='6')
+        self.if_resample = tk.BooleanVar(value=False)
+        self.resample_points = tk.StringVar(value='1000')
+        self.if_smooth = tk.BooleanVar(value=False)
+        self.smooth_window = tk.StringVar(value='11')
+        self.smooth_order = tk.StringVar(value='2')
+        baseline_options = ('なし',) + baseline_methods
+        self.baseline_method = tk.StringVar(value=baseline_options[0])
+        self.baseline_param = tk.StringVar(value='')
+        normalize_options = ('なし',) + NORMALIZE_MODES
+        self.normalize_mode = tk.StringVar(value=normalize_options[0])
+        self.normalize_position = tk.StringVar(value='')
+        check_despike = ttk.Checkbutton(master=labelframe_preprocess, variable=self.if_despike, text='スパイク除去')
+        label_despike = ttk.Label(master=labelframe_preprocess, text='閾値')
+        entry_despike = ttk.Entry(master=labelframe_preprocess, textvariable=self.despike_threshold, width=8, font=font_md)
+        check_resample = ttk.Checkbutton(master=labelframe_preprocess, variable=self.if_resample, text='共通グリッド')
+        label_resample = ttk.Label(master=labelframe_preprocess, text='点数')
+        entry_resample = ttk.Entry(master=labelframe_preprocess, textvariable=self.resample_points, width=8, font=font_md)
+        check_smooth = ttk.Checkbutton(master=labelframe_preprocess, variable=self.if_smooth, text='平滑化(SG)')
+        label_smooth = ttk.Label(master=labelframe_preprocess, text='窓 次数')
+        entry_smooth_window = ttk.Entry(master=labelframe_preprocess, textvariable=self.smooth_window, width=8, font=font_md)
+        entry_smooth_order = ttk.Entry(master=labelframe_preprocess, textvariable=self.smooth_order, width=8, font=font_md)
+        label_baseline = ttk.Label(master=labelframe_preprocess, text='BG除去')
+        optionmenu_baseline = ttk.OptionMenu(labelframe_preprocess, self.baseline_method, baseline_options[0], *baseline_options, command=self.baseline_method_changed)
+        optionmenu_baseline.config(width=10)
+        optionmenu_baseline['menu'].config(font=font_sm)
+        entry_baseline = ttk.Entry(master=labelframe_preprocess, textvariable=self.baseline_param, width=8, font=font_md)
+        label_normalize = ttk.Label(master=labelframe_preprocess, text='規格化')
+        optionmenu_normalize = ttk.OptionMenu(labelframe_preprocess, self.normalize_mode, normalize_options[0], *normalize_options)
+        optionmenu_normalize.config(width=10)
+        optionmenu_normalize['menu'].config(font=font_sm)
+        entry_normalize = ttk.Entry(master=labelframe_preprocess, textvariable=self.normalize_position, width=8, font=font_md)
+        button_preprocess = ttk.Button(master=labelframe_preprocess, text='適用', command=self.apply_preprocess)
+        labelframe_preprocess.grid(row=8, column=0, columnspan=4, padx=5, pady=5, sticky=tk.EW)
+        check_despike.grid(row=0, column=0, padx=5, sticky=tk.W)
+        label_despike.grid(row=0, column=1, padx=5)
+        entry_despike.grid(row=0, column=2, padx=5)
+        check_resample.grid(row=1, column=0, padx=5, sticky=tk.W)
+        label_resample.grid(row=1, column=1, padx=5)
+        entry_resample.grid(row=1, column=2, padx=5)
+        check_smooth.grid(row=2, column=0, padx=5, sticky=tk.W)
+        label_smooth.grid(row=2, column=1, padx=5)
+        entry_smooth_window.grid(row=2, column=2, padx=5)
+        entry_smooth_order.grid(row=2, column=3, padx=5)
+        label_baseline.grid(row=3, column=0, padx=5, sticky=tk.W)
+        optionmenu_baseline.grid(row=3, column=1, padx=5)
+        entry_baseline.grid(row=3, column=2, padx=5)
+        label_normalize.grid(row=4, column=0, padx=5, sticky=tk.W)
+        optionmenu_normalize.grid(row=4, column=1, padx=5)
+        entry_normalize.grid(row=4, column=2, padx=5)
+        button_preprocess.grid(row=5, column=0, columnspan=4, padx=5, pady=5)
+
+    def connect_canvas_events(self) -> None:
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+        self.canvas.mpl_connect('resize_event', self.update_decimation)
+
     def remove_spec_lines(self) -> None:
         for line in self.spec_lines.values():
             line.remove()
         self.spec_lines = {}
+        self.spec_line_states = {}
+        self.highlight_lines = {}
 
     def remove_vlines(self) -> None:
         for line in self.vlines:
@@ -348,40 +518,215 @@ class PGraph(tk.Frame):
         for obj in self.fitting_result:
             obj.remove()
         self.fitting_result = []
+        self.fitting_state = None
 
     def refresh(self, *remove_funcs) -> None:
-        self.remove_spec_lines()
+        # 毎回全ての線を描き直すと重いので，変更があった線だけを更新する
+        changed = len(remove_funcs) > 0
         for f in remove_funcs:  # 状況によって消したい線・残したい線が変わる
             f()
+
+        # 削除されたスペクトルの線を消す
+        for filename in list(self.spec_lines.keys()):
+            if filename not in self.dl.spec_dict:
+                self.spec_lines.pop(filename).remove()
+                del self.spec_line_states[filename]
+                changed = True
+        self.axis_cache.prune(self.dl.spec_dict)
+        xs = {id(state['x']) for state in self.spec_line_states.values()}
+        for key in [key for key in self.monotonic_cache if key not in xs]:
+            del self.monotonic_cache[key]
+        self.update_preprocess()
+
+        x_mode = self.get_x_mode()
         xlims = {'min': [1e10], 'max': [0]}
         ylims = {'min': [1e10], 'max': [0]}
         for filename, spec in self.dl.spec_dict.items():
-            linewidth = 2 if spec.highlight else 1
-
-            x = spec.xdata
-            if self.x_label.get() == self.x_labels[1]:  # エネルギー
-                x = 1240 / x
-            y = spec.ydata * spec.y_times
-
-            line = self.ax.plot(x, y + spec.y_shift, color=spec.color, linestyle=spec.linestyle, linewidth=linewidth)
-            self.spec_lines[filename] = line[0]
-
-            xlims['min'].append(min(x))
-            xlims['max'].append(max(x))
-            ylims['min'].append(min(y + spec.y_shift))
-            ylims['max'].append(max(y + spec.y_shift))
-
-        self.remove_fitting_result()
-        if self.if_show.get():
-            self.fitting_result = self.fitter.draw(self.ax)
+            line = self.spec_lines.get(filename)
+            if line is None:
+                line = self.ax.plot([], [])[0]
+                self.spec_lines[filename] = line
+            state = self.spec_line_states.get(filename)
+
+            # データ（配列が差し替えられたかどうかはidentityで判定する）
+            data_key = (x_mode, spec.y_times, spec.y_shift)
+            x, ydata = self.get_data(filename)
+            if state is None or state['data_key'] != data_key or state['x'] is not x or state['ydata'] is not ydata:
+                # 拡大・シフトしたyは全体を持たず，範囲は元のyの最小・最大から求める
+                y_range = np.array([np.min(ydata), np.max(ydata)]) * spec.y_times + spec.y_shift
+                state = {
+                    'data_key': data_key,
+                    'ydata': ydata,
+                    'x': x,
+                    'monotonic': self.is_monotonic(x),
+                    'limits': (np.min(x), np.max(x), np.min(y_range), np.max(y_range)),
+                    'style': None,
+                }
+                self.spec_line_states[filename] = state
+                self.set_line_data(filename)
+                changed = True
+
+            # 線の見た目（ハイライトはupdate_highlightで上から重ねる）
+            style = (spec.color, spec.linestyle)
+            if state['style'] != style:
+                line.set_color(spec.color)
+                line.set_linestyle(spec.linestyle)
+                line.set_linewidth(1)
+                state['style'] = style
+                changed = True
+
+            xmin, xmax, ymin, ymax = state['limits']
+            xlims['min'].append(xmin)
+            xlims['max'].append(xmax)
+            ylims['min'].append(ymin)
+            ylims['max'].append(ymax)
+
+        # フィッティング結果は結果が更新されたときだけ描き直す
+        fitting_state = (self.if_show.get(), self.fitter.params_fit, self.fitter.x)
+        if self.fitting_state is None or any(a is not b for a, b in zip(fitting_state, self.fitting_state)):
+            self.remove_fitting_result()
+            if self.if_show.get():
+                self.fitting_result = self.fitter.draw(self.ax)
+                for obj in self.fitting_result:
+                    obj.set_animated(True)
+            self.fitting_state = fitting_state
+            changed = True
 
         xlim = [min(xlims['min']), max(xlims['max'])]
         ylim = [min(ylims['min']) * 0.9, max(ylims['max']) * 1.1]
-        self.set_range(xlim, ylim)
+        if self.set_range(xlim, ylim):
+            changed = True
+
+        highlight_changed = self.update_highlight()
+        if changed:
+            self.canvas.draw()
+        elif highlight_changed:
+            self.blit()
+
+    def set_line_data(self, filename: str) -> None:
+        # 描画範囲のピクセル数より点数が多い場合は，見た目が変わらない範囲で間引いて線に渡す
+        # 間引きで選ぶ点は1次変換で変わらないので，拡大・シフトは間引いた後の点だけにかける
+        state = self.spec_line_states[filename]
+        x, y = state['x'], state['ydata']
+        if state['monotonic']:
+            x, y = decimate_minmax(x, y, self.ax.get_xlim(), int(self.ax.bbox.width))
+        _, y_times, y_shift = state['data_key']
+        if y_times != 1 or y_shift != 0:
+            y = y * y_times + y_shift
+        self.spec_lines[filename].set_data(x, y)
+        highlight_line = self.highlight_lines.get(filename)
+        if highlight_line is not None:
+            highlight_line.set_data(x, y)
+
+    def is_monotonic(self, x: np.ndarray) -> bool:
+        # 同じxを共有するスペクトルでは1回だけ調べる
+        entry = self.monotonic_cache.get(id(x))
+        if entry is None or entry[0] is not x:
+            dx = np.diff(x)
+            entry = (x, bool(np.all(dx >= 0) or np.all(dx <= 0)))
+            self.monotonic_cache[id(x)] = entry
+        return entry[1]
+
+    def update_decimation(self, event=None) -> None:
+        for filename in self.spec_lines.keys():
+            self.set_line_data(filename)
+
+    def update_highlight(self) -> bool:
+        # ハイライトした線は背景に含めず，blitで上から重ねて描画する
+        changed = False
+        for filename in list(self.highlight_lines.keys()):
+            spec = self.dl.spec_dict.get(filename)
+            if spec is None or not spec.highlight or filename not in self.spec_lines:
+                self.highlight_lines.pop(filename).remove()
+                del self.highlight_states[filename]
+                changed = True
 
-        self.canvas.draw()
+        for filename, spec in self.dl.spec_dict.items():
+            if not spec.highlight or filename not in self.spec_lines:
+                continue
+            line = self.spec_lines[filename]
+            highlight_line = self.highlight_lines.get(filename)
+            if highlight_line is None:
+                highlight_line = self.ax.plot([], [], linewidth=2, animated=True)[0]
+                self.highlight_lines[filename] = highlight_line
+                changed = True
+            # 元の線のデータが更新された場合だけデータを写す
+            state = self.spec_line_states[filename]
+            if self.highlight_states.get(filename) is not state:
+                highlight_line.set_data(*line.get_data())
+                self.highlight_states[filename] = state
+                changed = True
+            highlight_line.set_color(line.get_color())
+            highlight_line.set_linestyle(line.get_linestyle())
+
+        return changed
+
+    def get_animated_artists(self) -> list:
+        artists = list(self.highlight_lines.values()) + self.vlines + self.hlines + self.fitting_result
+        return artists
+
+    def on_draw(self, event=None) -> None:
+        # 全体を描画した直後に，動的な要素を除いた背景を保存しておく
+        # PDF・SVGへの保存（savefig）でも別のキャンバスからdraw_eventが来るので，画面のキャンバス以外は無視する
+        if event is not None and event.canvas is not self.canvas:
+            return
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        # 保存中はanimatedを解除していて通常の描画に含まれるので，重ねて描かない
+        for artist in self.get_animated_artists():
+            if artist.get_animated():
+                self.ax.draw_artist(artist)
+
+    def blit(self) -> None:
+        # 保存しておいた背景に，ハイライト・縦線・横線・フィッティング結果だけを描き足す
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        for artist in self.get_animated_artists():
+            self.ax.draw_artist(artist)
+        self.canvas.blit(self.fig.bbox)
+
+    def get_laser_wavelength(self):
+        try:
+            laser_wavelength = float(self.laser_wavelength.get())
+        except ValueError:
+            return None
+        return laser_wavelength if laser_wavelength > 0 else None
+
+    def get_x_mode(self) -> tuple:
+        # 表示単位と励起波長．変換したxのキャッシュのキーになる
+        return x_units[self.x_labels.index(self.x_label.get())], self.get_laser_wavelength()
+
+    def get_data(self, filename: str) -> (np.ndarray, np.ndarray):
+        # 表示単位に変換してから前処理したx, y．どちらもキャッシュされる
+        # 前処理は全スペクトルについてまとめて計算する（リサンプルの範囲が全体で決まるため）
+        if len(self.pipeline) > 0 and self.preprocess_cache.pipeline != self.pipeline:
+            self.update_preprocess()
+        spec = self.dl.spec_dict[filename]
+        x = self.axis_cache.get(spec, *self.get_x_mode())
+        return self.preprocess_cache.get(filename, x, spec.ydata, self.pipeline)
+
+    def get_xdata(self, filename: str) -> np.ndarray:
+        return self.get_data(filename)[0]
+
+    def get_ydata(self, filename: str) -> np.ndarray:
+        return self.get_data(filename)[1]
+
+    def get_data_mode(self) -> tuple:
+        # 横軸の単位と前処理のパイプライン．結合したデータのキャッシュのキーになる
+        return self.get_x_mode(), self.pipeline
+
+    def update_preprocess(self) -> None:
+        # 新しく読み込んだものなど，古くなったスペクトルの前処理だけをまとめて計算する
+        self.preprocess_cache.prune(self.dl.spec_dict)
+        if len(self.pipeline) == 0:
+            return
+        x_mode = self.get_x_mode()
+        data = {filename: (self.axis_cache.get(spec, *x_mode), spec.ydata) for filename, spec in self.dl.spec_dict.items()}
+        self.preprocess_cache.apply_all(data, self.pipeline)
 
-    def set_range(self, xlim, ylim) -> None:
+    def set_range(self, xlim, ylim) -> bool:
+        # 軸の設定が変わったかどうかを返す
         try:
             xmin = float(self.entry_xmin.get())
         except ValueError:
@@ -398,8 +743,6 @@ class PGraph(tk.Frame):
             ymax = float(self.entry_ymax.get())
         except ValueError:
             ymax = ylim[1]
-        self.ax.set(xlim=(xmin, xmax), ylim=(ymin, ymax))
-
         try:
             num_xticks = int(self.xticks.get()) + 1
         except ValueError:
@@ -409,6 +752,18 @@ class PGraph(tk.Frame):
         except ValueError:
             num_yticks = 5
 
+        axes_state = (
+            xmin, xmax, ymin, ymax, num_xticks, num_yticks,
+            self.x_label.get(), self.y_label.get(),
+            self.x_labelsize.get(), self.y_labelsize.get(), self.xtick_labelsize.get(), self.ytick_labelsize.get(),
+        )
+        # ツールバーでズームした場合などは設定が同じでも範囲を戻す
+        if axes_state == self.axes_state and self.ax.get_xlim() == (xmin, xmax) and self.ax.get_ylim() == (ymin, ymax):
+            return False
+        self.axes_state = axes_state
+
+        self.ax.set(xlim=(xmin, xmax), ylim=(ymin, ymax))
+
         xticks = np.linspace(xmin, xmax, num_xticks)
         yticks = np.linspace(ymin, ymax, num_yticks)
 
@@ -425,6 +780,8 @@ class PGraph(tk.Frame):
         except ValueError:
             messagebox.showerror('エラー', 'ラベルサイズには整数を入力してください。')
 
+        return True
+
     def get_graph_range(self) -> [list, list]:
         xmin = self.entry_xmin.get()
         xmax = self.entry_xmax.get()
@@ -477,17 +834,17 @@ class PGraph(tk.Frame):
         x = float(self.vline_x_value.get())
         color = self.vlinecolor[0]
         linestyle = self.vlinestyle.get()
-        line = self.ax.axvline(x=x, color=color, linestyle=linestyle)
+        line = self.ax.axvline(x=x, color=color, linestyle=linestyle, animated=True)
         self.vlines.append(line)
-        self.canvas.draw()
+        self.blit()
 
     def apply_hline(self, event=None) -> None:
         y = float(self.hline_y_value.get())
         color = self.hlinecolor[0]
         linestyle = self.hlinestyle.get()
-        line = self.ax.axhline(y=y, color=color, linestyle=linestyle)
+        line = self.ax.axhline(y=y, color=color, linestyle=linestyle, animated=True)
         self.hlines.append(line)
-        self.canvas.draw()
+        self.blit()
 
     def reset_lines(self) -> None:
         self.refresh(self.remove_vlines, self.remove_hlines)
@@ -497,10 +854,54 @@ class PGraph(tk.Frame):
             filenames = list(map(lambda x: x.strip('{').strip('}'), event.data.split('} {')))
         else:
             filenames = event.data.split()
-        self.dl.load_files(filenames)
-        self.treeview_file.load(self.dl.spec_dict)
-        self.check_device(filenames[0])
-        self.refresh()
+        # 読み込みは別スレッドで行い，終わったものから順に表示する
+        if self.loader is None:
+            self.loader = AsyncLoader(cache=self.get_spec_cache())
+            self.filename_check_device = filenames[0]
+            self.after(100, self.poll_loading)
+        self.loader.add(filenames)
+        self.progress_loading.config(maximum=self.loader.num_total)
+        self.button_cancel_loading.config(state=tk.NORMAL)
+
+    def get_spec_cache(self):
+        if not self.spec_cache_opened:
+            self.spec_cache_opened = True
+            try:
+                self.spec_cache = SpecCache()
+            except OSError:  # キャッシュ用のフォルダが作れない場合はキャッシュを使わない
+                self.spec_cache = None
+        return self.spec_cache
+
+    def poll_loading(self) -> None:
+        spec_dict = self.loader.poll()
+        if len(spec_dict) > 0:
+            # マッピングデータなどは届いた分からメモリマップの配列にまとめてメモリを節約する
+            self.spec_store.add(spec_dict)
+            self.dl.spec_dict.update(spec_dict)
+            self.treeview_file.load(self.dl.spec_dict)
+            if self.filename_check_device in spec_dict:
+                self.check_device(self.filename_check_device)
+            self.refresh()
+        self.progress_loading.config(value=self.loader.num_done)
+        self.label_loading.config(text=f'{self.loader.num_done}/{self.loader.num_total}')
+
+        if not self.loader.is_done():
+            self.after(100, self.poll_loading)
+            return
+
+        # 読み込み終了
+        errors = self.loader.errors
+        self.loader.shutdown()
+        self.loader = None
+        self.button_cancel_loading.config(state=tk.DISABLED)
+        # 途中まで書いた配列も読み込み専用にする
+        self.spec_store.finish()
+        if len(errors) > 0:
+            messagebox.showerror('Error', f'以下のファイルを読み込めませんでした．\n{", ".join(errors.keys())}')
+
+    def cancel_loading(self) -> None:
+        if self.loader is not None:
+            self.loader.cancel()
 
     def select(self, event=None) -> None:
         self.dl.reset_highlight()
@@ -513,12 +914,15 @@ class PGraph(tk.Frame):
         self.set_linecolor(self.dl.spec_dict[filename].color)
         self.y_shift_value.set(self.dl.spec_dict[filename].y_shift)
         self.y_times_value.set(self.dl.spec_dict[filename].y_times)
-        self.refresh()
+        # ハイライトの変更だけなので全体は描き直さない
+        if self.update_highlight():
+            self.blit()
 
     def reset_selection(self) -> None:
         self.treeview_file.selection_remove(self.treeview_file.selection())
         self.dl.reset_highlight()
-        self.refresh()
+        if self.update_highlight():
+            self.blit()
 
     def check_device(self, filename: str) -> None:
         device = self.dl.spec_dict[filename].device
@@ -543,6 +947,15 @@ class PGraph(tk.Frame):
 
         return params
 
+    def get_params_as_float(self) -> list:
+        params = self.get_params_from_text()
+        try:
+            params = [float(value.replace(r'\x7f308', '')) for sublist in params for value in sublist]
+        except ValueError:
+            messagebox.showerror('Error', 'パラメータが無効です．数値以外の文字が含まれている可能性があります．')
+            return None
+        return params
+
     def function_changed(self, event=None) -> None:
         pre_num = self.fitter.num_params_per_func
         pre_params = self.get_params_from_text()
@@ -574,6 +987,76 @@ class PGraph(tk.Frame):
         self.text_params.delete(1.0, tk.END)
         self.text_params.insert(1.0, params_default)
 
+    def baseline_method_changed(self, event=None) -> None:
+        # 手法ごとにパラメータの意味が違うので既定値を入れる（ALS: λ, Polynomial: 次数, RollingBall: 半径[点]）
+        param = baseline_default_params.get(self.baseline_method.get())
+        self.baseline_param.set('' if param is None else f'{param:g}')
+
+    def get_pipeline(self) -> tuple:
+        # 前処理の設定からパイプラインを作る．無効な値があればValueError
+        # スパイクは補間でなまる前に除き，それ以降は共通のグリッドにそろえた1つの配列で処理する
+        pipeline = []
+        if self.if_despike.get():
+            pipeline.append(('despike', float(self.despike_threshold.get())))
+        if self.if_resample.get():
+            num_points = int(self.resample_points.get())
+            if num_points < 2:
+                raise ValueError
+            pipeline.append(('resample', num_points))
+        if self.if_smooth.get():
+            window, order = int(self.smooth_window.get()), int(self.smooth_order.get())
+            if window < 3 or not 0 <= order < window:
+                raise ValueError
+            pipeline.append(('smooth', window, order))
+        if self.baseline_method.get() in baseline_methods:
+            param = float(self.baseline_param.get())
+            if param <= 0:
+                raise ValueError
+            pipeline.append(('baseline', self.baseline_method.get(), param))
+        if self.normalize_mode.get() in NORMALIZE_MODES:
+            # peakの位置は表示単位
+            position = float(self.normalize_position.get()) if self.normalize_mode.get() == 'peak' else None
+            pipeline.append(('normalize', self.normalize_mode.get(), position))
+        return tuple(pipeline)
+
+    def apply_preprocess(self) -> None:
+        try:
+            pipeline = self.get_pipeline()
+        except ValueError:
+            messagebox.showerror('Error', '前処理のパラメータが無効です．')
+            return
+        if pipeline == self.pipeline:
+            return
+        # yが変わるので，結合データも作り直す（前処理はrefreshでまとめて計算される）
+        self.pipeline = pipeline
+        self.fit_data.invalidate()
+        self.refresh()
+
+    def estimate_params(self) -> None:
+        # 選択されたスペクトル（なければ先頭）のピークを検出して，表示範囲での初期値を入力する
+        if len(self.dl.spec_dict) == 0:
+            messagebox.showerror('Error', 'スペクトルが読み込まれていません．')
+            return
+        iids = self.treeview_file.selection()
+        if len(iids) == 0:
+            iids = self.treeview_file.get_children()
+        filename = self.treeview_file.get_filename(iids[0])
+
+        from autoguess import estimate_params  # scipy.signalを読み込むので使うときに
+
+        xlim, _ = self.get_graph_range()
+        function = self.function_fitting.get()
+        params = estimate_params(self.get_xdata(filename), np.asarray(self.get_ydata(filename)), xlim, function)
+        if len(params) == 2:
+            messagebox.showwarning('Warning', 'ピークが見つかりませんでした．')
+            return
+
+        # self.fitterには前のフィッティング結果が残っていて描画に使うので，形式を決めるだけの別のFitを使う
+        fitter = Fit()
+        fitter.set_function(function)
+        fitter.set_params(params)
+        self.show_params(self.text_params, params, fitter)
+
     def fit(self) -> None:
         num_spec = len(self.dl.spec_dict)
         if num_spec == 0:
@@ -581,41 +1064,214 @@ class PGraph(tk.Frame):
             return
         elif num_spec > 2:
             messagebox.showwarning('Warning', '全てのスペクトルを結合してフィッティングを行います．')
-        df_fit = self.dl.concat_spec()
-        df_fit = df_fit.sort_values('x', ascending=False)
-
-        x = df_fit.x.values
-        if self.x_label.get() == 2:  # エネルギー
-            x = 1240 / x
-        y = df_fit.y.values
+        # 結合・ソート済みのデータはスペクトルが変わるまで使い回す
+        x, y = self.fit_data.get(self.dl.spec_dict, self.get_data_mode(), self.get_xdata, self.get_ydata)
 
         # 表示範囲だけにトリミング
         xlim, _ = self.get_graph_range()
-        self.fitter.set_data(x, y, xlim)
-
-        params = self.get_params_from_text()
-        try:
-            params = [float(value.replace(r'\x7f308', '')) for sublist in params for value in sublist]
-        except ValueError:
-            messagebox.showerror('Error', 'パラメータが無効です．数値以外の文字が含まれている可能性があります．')
+        params = self.get_params_as_float()
+        if params is None:
             return
 
-        self.fitter.set_params(params)
-        if self.fitter.fit():
+        # 描画中のself.fitterと競合しないよう，別のFitで計算して終わったら差し替える
+        function = self.function_fitting.get()
+        fitter = Fit()
+        fitter.set_function(function)
+        fitter.set_data(x, y, xlim, is_sorted=True)
+        fitter.set_params(params)
+        fitter.cancel_event = self.fit_cancel_event
+
+        def on_done(ok: bool) -> None:
+            self.record_fit_stats({'combined': fitter.stats}, function, xlim)
+            if not ok:
+                messagebox.showerror('Error', 'フィッティングに失敗しました．パラメータを変えてください．')
+                return
+            self.fitter = fitter
             messagebox.showinfo('Info', 'フィッティングに成功しました．')
+            self.show_params(self.text_params_fit, self.fitter.params_fit)
+            self.refresh()
+
+        self.run_fitting(fitter.fit, on_done)
+
+    def fit_batch(self) -> None:
+        # 読み込まれている全てのスペクトルを，同じモデル・初期値で個別にフィッティングする
+        if len(self.dl.spec_dict) == 0:
+            messagebox.showerror('Error', 'スペクトルが読み込まれていません．')
+            return
+
+        xlim, _ = self.get_graph_range()
+        params = self.get_params_as_float()
+        if params is None:
+            return
+
+        function = self.function_fitting.get()
+        data = {filename: (self.get_xdata(filename), self.get_ydata(filename)) for filename in self.dl.spec_dict}
+        stats = {}
+
+        def on_done(results: dict) -> None:
+            self.record_fit_stats(stats, function, xlim)
+            self.apply_fit_results(results, function, xlim)
+
+        self.run_fitting(lambda: fit_spectra(data, xlim, function, params, stats=stats, cancel_event=self.fit_cancel_event,
+                                             progress=self.count_fitted), on_done, len(data))
+
+    def fit_sequential(self) -> None:
+        # 前のスペクトルの結果を次のスペクトルの初期値にして順番にフィッティングする
+        # 順番はリストの表示順．選択されている場合は選択されたスペクトルのみ
+        if len(self.dl.spec_dict) == 0:
+            messagebox.showerror('Error', 'スペクトルが読み込まれていません．')
+            return
+
+        xlim, _ = self.get_graph_range()
+        params = self.get_params_as_float()
+        if params is None:
+            return
+
+        iids = self.treeview_file.selection()
+        if len(iids) == 0:
+            iids = self.treeview_file.get_children()
+        iids = [iid for iid in self.treeview_file.get_children() if iid in iids]
+
+        function = self.function_fitting.get()
+        data = {}
+        for iid in iids:
+            filename = self.treeview_file.get_filename(iid)
+            data[filename] = (self.get_xdata(filename), self.get_ydata(filename))
+        stats = {}
+
+        def on_done(results: dict) -> None:
+            self.record_fit_stats(stats, function, xlim)
+            self.apply_fit_results(results, function, xlim)
+
+        self.run_fitting(lambda: fit_spectra_sequential(data, xlim, function, params, stats=stats, cancel_event=self.fit_cancel_event,
+                                                        progress=self.count_fitted), on_done, len(data))
+
+    def fit_global(self) -> None:
+        # 全てのスペクトルを，チェックしたパラメータを共通にして同時にフィッティングする
+        if len(self.dl.spec_dict) == 0:
+            messagebox.showerror('Error', 'スペクトルが読み込まれていません．')
+            return
+
+        xlim, _ = self.get_graph_range()
+        params = self.get_params_as_float()
+        if params is None:
+            return
+
+        function = self.function_fitting.get()
+        # 描画中のself.fitterは変えず，パラメータ数は別のFitで調べる
+        fitter = Fit()
+        fitter.set_function(function)
+        shared = []
+        if self.share_center.get():
+            shared.append(0)
+        if self.share_width.get():
+            shared.extend(range(2, fitter.num_params_per_func))
+        data = {filename: (self.get_xdata(filename), self.get_ydata(filename)) for filename in self.dl.spec_dict}
+        stats = {}
+
+        def on_done(results: dict) -> None:
+            self.record_fit_stats(stats, function, xlim)
+            self.apply_fit_results(results, function, xlim)
+
+        self.run_fitting(lambda: fit_spectra_global(data, xlim, function, params, shared, stats=stats,
+                                                    cancel_event=self.fit_cancel_event), on_done)
+
+    def run_fitting(self, target, callback, num_total: int = 0) -> None:
+        # targetを別スレッドで実行し，終わったらその戻り値でcallbackをTkのスレッドから呼ぶ
+        # num_totalはプログレスバーの最大値（スペクトルの本数）．0の場合は進み具合が分からないので往復させる
+        if self.fit_future is not None:
+            messagebox.showwarning('Warning', 'フィッティング中です．')
+            return
+        self.fit_cancel_event.clear()
+        self.fit_num_done = 0
+        self.fit_callback = callback
+        if num_total > 0:
+            self.progress_fitting.config(mode='determinate', maximum=num_total, value=0)
         else:
-            messagebox.showerror('Error', 'フィッティングに失敗しました．パラメータを変えてください．')
+            self.progress_fitting.config(mode='indeterminate')
+            self.progress_fitting.start(20)
+        self.button_cancel_fitting.config(state=tk.NORMAL)
+        self.label_fit_stats.config(text='フィッティング中...')
+        self.fit_future = self.fit_executor.submit(target)
+        self.after(100, self.poll_fitting)
+
+    def count_fitted(self, filename: str) -> None:
+        # ワーカースレッドから呼ばれる．値はpoll_fittingで読む
+        self.fit_num_done += 1
+
+    def poll_fitting(self) -> None:
+        if not self.fit_future.done():
+            if self.progress_fitting.cget('mode') == 'determinate':
+                self.progress_fitting.config(value=self.fit_num_done)
+            self.after(100, self.poll_fitting)
+            return
+
+        # フィッティング終了
+        future = self.fit_future
+        callback = self.fit_callback
+        self.fit_future = None
+        self.fit_callback = None
+        self.progress_fitting.stop()
+        self.progress_fitting.config(mode='determinate', value=0)
+        self.button_cancel_fitting.config(state=tk.DISABLED)
+        try:
+            result = future.result()
+        except FitCancelled:
+            self.label_fit_stats.config(text='フィッティングを中止しました．')
             return
+        except (ValueError, TypeError) as e:  # 範囲内のデータ点がパラメータ数より少ない場合など
+            self.label_fit_stats.config(text='')
+            messagebox.showerror('Error', f'フィッティングできませんでした．\n{e}')
+            return
+        callback(result)
 
-        self.show_params(self.text_params_fit, self.fitter.params_fit)
+    def cancel_fitting(self) -> None:
+        self.fit_cancel_event.set()
 
-        self.refresh()
+    def record_fit_stats(self, stats: dict, function: str, xlim: list) -> None:
+        # フィッティングの記録をファイルに追記し，要約を表示する
+        if len(stats) == 1:
+            self.label_fit_stats.config(text=format_stats(next(iter(stats.values()))))
+        else:
+            self.label_fit_stats.config(text=summarize_stats(stats))
+        try:
+            write_fit_log(stats, function, xlim)
+        except OSError:  # 記録できなくてもフィッティング自体は続ける
+            pass
+
+    def apply_fit_results(self, results: dict, function: str, xlim: list) -> None:
+        failed = []
+        dropped = []  # フィッティング中に削除されたスペクトル
+        for filename, params_fit in results.items():
+            spec = self.dl.spec_dict.get(filename)
+            if spec is None:
+                dropped.append(filename)
+                continue
+            if params_fit is None:
+                failed.append(filename)
+                continue
+            spec.fitting_function = function
+            spec.fitting_range = xlim
+            spec.fitting_values = params_fit.tolist()
 
-    def show_params(self, textbox: tk.Text, params: list) -> None:
+        self.treeview_file.load(self.dl.spec_dict)
+        if len(failed) == 0 and len(dropped) == 0:
+            messagebox.showinfo('Info', f'{len(results)}個のスペクトルのフィッティングに成功しました．')
+            return
+        messages = []
+        if len(failed) > 0:
+            messages.append(f'以下のスペクトルのフィッティングに失敗しました．\n{", ".join(failed)}')
+        if len(dropped) > 0:
+            messages.append(f'以下のスペクトルはフィッティング中に削除されたため，結果を破棄しました．\n{", ".join(dropped)}')
+        messagebox.showwarning('Warning', '\n\n'.join(messages))
+
+    def show_params(self, textbox: tk.Text, params: list, fitter: Fit = None) -> None:
+        if fitter is None:
+            fitter = self.fitter
         text = ''
-        for i in range(self.fitter.num_func):
-            for j in range(self.fitter.num_params_per_func):
-                text += str(round(params[i * self.fitter.num_params_per_func + j], 3)) + ' '
+        for i in range(fitter.num_func):
+            for j in range(fitter.num_params_per_func):
+                text += str(round(params[i * fitter.num_params_per_func + j], 3)) + ' '
             text += '\n'
         text += str(round(params[-2], 3)) + ' ' + str(round(params[-1], 3)) + '\n'
         textbox.delete(1.0, tk.END)
@@ -623,9 +1279,16 @@ class PGraph(tk.Frame):
 
     def load_params(self) -> None:
         filename = self.treeview_file.get_filename()
-        func = self.dl.spec_dict[filename].fitting_function
-        fitting_range = self.dl.spec_dict[filename].fitting_range
-        params = self.dl.spec_dict[filename].fitting_values
+        spec = self.dl.spec_dict[filename]
+        result = self.result_store.get(filename, spec) if self.result_store is not None else None
+        if result is not None:
+            func = result['function']
+            fitting_range = result['range']
+            params = result['params']
+        else:  # 保存されていなければファイルに追記されたパラメータを使う
+            func = spec.fitting_function
+            fitting_range = spec.fitting_range
+            params = spec.fitting_values
         if len(params) == 0:
             messagebox.showerror('Error', 'パラメータが見つかりませんでした．')
             return
@@ -644,14 +1307,41 @@ class PGraph(tk.Frame):
 
     def save_params(self) -> None:
         # 現在ロードされているすべてのファイルにパラメータを保存
-        if self.fitter.params_fit is None:
+        # 結果はデータベースにまとめて書き込み，ファイルは書き換えない
+        # 各スペクトルの結果（一括・逐次・グローバルフィッティング）はそのまま保存し，
+        # 結果のないスペクトルにだけ，結合してフィッティングした結果を入れる
+        function = self.function_fitting.get()
+        specs = {}
+        for filename, spec in self.dl.spec_dict.items():
+            if len(spec.fitting_values) == 0:
+                if self.fitter.params_fit is None:
+                    continue
+                spec.fitting_function = function
+                spec.fitting_range = self.fitter.xlim
+                spec.fitting_values = self.fitter.params_fit.tolist()
+            specs[filename] = spec
+        if len(specs) == 0:
             messagebox.showerror('Error', 'フィッティングを行ってください．')
             return
+
+        if self.result_store is not None:
+            # put_manyは関数と範囲が共通なので，それごとにまとめて書き込む
+            groups = {}
+            for filename, spec in specs.items():
+                key = (spec.fitting_function, tuple(spec.fitting_range))
+                groups.setdefault(key, {})[filename] = (spec, spec.fitting_values)
+            try:
+                num_saved = sum(self.result_store.put_many(results, func, list(xlim))
+                                for (func, xlim), results in groups.items())
+            except sqlite3.Error as e:
+                messagebox.showerror('Error', f'保存できませんでした．\n{e}')
+                return
+            self.treeview_file.load(self.dl.spec_dict)
+            messagebox.showinfo('Info', f'{num_saved}個のスペクトルのパラメータを{self.result_store.path}に保存しました．')
+            return
+
         filenames_new = []
-        for filename, _ in self.dl.spec_dict.items():
-            self.dl.spec_dict[filename].fitting_function = self.function_fitting.get()
-            self.dl.spec_dict[filename].fitting_range = self.fitter.xlim
-            self.dl.spec_dict[filename].fitting_values = self.fitter.params_fit.tolist()
+        for filename in specs:
             filename_new = self.dl.save(filename)
             filenames_new.append(filename_new)
         messagebox.showinfo('Info', f'パラメータを追記したファイルを{", ".join(filenames_new)}に保存しました．')
@@ -671,6 +1361,11 @@ class PGraph(tk.Frame):
         self.treeview_file.load(self.dl.spec_dict, True, True)
 
     def quit(self) -> None:
+        self.fit_cancel_event.set()
+        self.fit_executor.shutdown(wait=False)
+        self.spec_store.close()
+        if self.result_store is not None:
+            self.result_store.close()
         self.master.quit()
         self.master.destroy()
 
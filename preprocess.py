@@ -0,0 +1,231 @@
+import numpy as np
+from baseline import METHODS as baseline_methods, estimate_baseline
+
+# 読み込んだ全スペクトルの前処理
+# 同じxを持つスペクトルを(スペクトル数, 点数)の2次元配列に並べ，各ステップを配列全体に一度にかける
+# パイプラインはステップのタプルを並べたタプル．比較できるのでそのままキャッシュのキーになる
+#   ('despike', threshold)          宇宙線などのスパイク除去（差分の修正zスコアがthresholdを超えて急に上下する点を前後から線形補間する）
+#   ('smooth', window, polyorder)   Savitzky-Golayで平滑化
+#   ('baseline', method, param)     ベースラインを差し引く（baseline.estimate_baseline）
+#   ('normalize', mode, position)   'max': 最大値, 'area': 面積, 'peak': positionに最も近い点の値で割る
+#   ('resample', num_points)        全スペクトルに共通する範囲の等間隔のグリッドに線形補間する．以降は1つの配列になる
+# 例: (('despike', 6), ('smooth', 11, 2), ('baseline', 'ALS', 1e5), ('normalize', 'max', None))
+
+STEPS = ('despike', 'smooth', 'baseline', 'normalize', 'resample')
+NORMALIZE_MODES = ('max', 'area', 'peak')
+
+
+def remove_spikes(y: np.ndarray, threshold: float = 6.0) -> np.ndarray:
+    # Whitaker-Hayes: 隣との差分の修正zスコア（中央値と中央絶対偏差を使う）で急な変化を見つける
+    # 鋭いピークの裾も急なので，急に上がって1〜2点のうちに急に下がるものだけをスパイクとする
+    # スパイクとその両隣は，前後のスパイクでない点から線形補間する
+    y = np.asarray(y, dtype=float)
+    n = y.shape[-1]
+    if n < 3:
+        return y
+    d = np.diff(y, axis=-1)
+    k = (n - 1) // 2  # 中央値はpartitionで求める（偶数個のときは中央の下側）
+    median = np.partition(d, k, axis=-1)[..., k:k + 1]
+    mad = np.partition(np.abs(d - median), k, axis=-1)[..., k:k + 1]
+    z = 0.6745 * (d - median) / np.where(mad > 0, mad, np.inf)
+    up = z > threshold
+    down = z < -threshold
+    single = up[..., :-1] & down[..., 1:]  # 1点: d[i]で上がりd[i+1]で下がる -> 点i+1
+    double = up[..., :-2] & down[..., 2:]  # 2点: d[i]で上がりd[i+2]で下がる -> 点i+1, i+2
+    if not (single.any() or double.any()):
+        return y
+    core = np.zeros(y.shape, dtype=bool)
+    core[..., 1:-1] |= single
+    core[..., 1:-2] |= double
+    core[..., 2:-1] |= double
+    spikes = core.copy()
+    spikes[..., :-1] |= core[..., 1:]
+    spikes[..., 1:] |= core[..., :-1]
+    spikes[..., 0] = spikes[..., -1] = False  # 両端は残すので，補間は同じスペクトルの中で閉じる
+
+    # 全スペクトルを1本につないで，スパイクでない点から線形補間する
+    shape = y.shape
+    y = y.ravel().copy()
+    spikes = spikes.ravel()
+    index = np.arange(len(y))
+    y[spikes] = np.interp(index[spikes], index[~spikes], y[~spikes])
+    return y.reshape(shape)
+
+
+def smooth(y: np.ndarray, window: int = 11, polyorder: int = 2) -> np.ndarray:
+    from scipy.signal import savgol_filter
+
+    y = np.asarray(y, dtype=float)
+    n = y.shape[-1]
+    window = min(int(window) | 1, n if n % 2 == 1 else n - 1)  # 奇数で点数以下
+    if window <= polyorder:
+        return y
+    return savgol_filter(y, window, int(polyorder), axis=-1, mode='interp')
+
+
+def normalize(x: np.ndarray, y: np.ndarray, mode: str = 'max', position: float = None) -> np.ndarray:
+    y = np.asarray(y, dtype=float)
+    if mode == 'max':
+        scale = np.max(np.abs(y), axis=-1, keepdims=True)
+    elif mode == 'area':
+        # 台形積分（np.trapzはnumpyのバージョンによって名前が違うので直接計算する）
+        area = np.sum((y[..., 1:] + y[..., :-1]) * np.diff(np.asarray(x, dtype=float)), axis=-1) / 2
+        scale = np.abs(area)[..., np.newaxis]
+    elif mode == 'peak':
+        if position is None:
+            raise ValueError('Normalization by peak needs the peak position.')
+        i = int(np.argmin(np.abs(np.asarray(x) - position)))
+        scale = np.abs(y[..., i:i + 1])
+    else:
+        raise ValueError(f'Unsupported normalization: {mode}')
+    return y / np.where(scale > 0, scale, 1)
+
+
+def resample(x: np.ndarray, y: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    # 共通のxを持つ2次元配列をまとめて線形補間する（np.interpは1本ずつなので，位置と重みを1回だけ求める）
+    # 範囲外は端の値にする
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x[0] > x[-1]:
+        x = x[::-1]
+        y = y[..., ::-1]
+    i = np.clip(np.searchsorted(x, grid), 1, len(x) - 1)
+    x0 = x[i - 1]
+    x1 = x[i]
+    w = np.clip((grid - x0) / np.where(x1 > x0, x1 - x0, 1), 0, 1)
+    return y[..., i - 1] * (1 - w) + y[..., i] * w
+
+
+def get_common_range(data: dict) -> (float, float):
+    # 全スペクトルに共通する範囲．重ならない場合は全体の範囲
+    ranges = np.array([(np.min(x), np.max(x)) for x, _ in data.values()])
+    low, high = ranges[:, 0].max(), ranges[:, 1].min()
+    if low >= high:
+        low, high = ranges[:, 0].min(), ranges[:, 1].max()
+    return float(low), float(high)
+
+
+def resolve(pipeline: tuple, data: dict) -> tuple:
+    # 全スペクトルで決まるもの（リサンプルのグリッド）を埋めたパイプライン
+    # ('resample', num_points) -> ('resample', num_points, low, high)
+    resolved = []
+    for step in pipeline:
+        if step[0] == 'resample' and len(step) == 2:
+            step = step + get_common_range(data)
+        resolved.append(step)
+    return tuple(resolved)
+
+
+def check_pipeline(pipeline: tuple) -> None:
+    for step in pipeline:
+        if step[0] not in STEPS:
+            raise ValueError(f'Unknown preprocessing step: {step[0]}')
+        if step[0] == 'baseline' and step[1] not in baseline_methods:
+            raise ValueError(f'Unsupported baseline method: {step[1]}')
+        if step[0] == 'normalize' and step[1] not in NORMALIZE_MODES:
+            raise ValueError(f'Unsupported normalization: {step[1]}')
+
+
+def group_by_xdata(data: dict) -> list:
+    # 同じxを持つスペクトルごとに分ける [(x, [name, ...]), ...]
+    # 点数と両端で候補を絞ってから中身を比べる
+    groups = {}
+    for name, (x, _) in data.items():
+        x = np.asarray(x)
+        key = (len(x), x[0], x[-1]) if len(x) > 0 else (0,)
+        candidates = groups.setdefault(key, [])
+        for x_ref, names in candidates:
+            if x_ref is x or np.array_equal(x_ref, x):
+                names.append(name)
+                break
+        else:
+            candidates.append((x, [name]))
+    return [group for candidates in groups.values() for group in candidates]
+
+
+def run_pipeline(data: dict, pipeline: tuple) -> dict:
+    # data: {name: (x, y)} -> {name: (x, y)}．同じグループのスペクトルは同じxの配列を共有する
+    if len(data) == 0 or pipeline is None or len(pipeline) == 0:
+        return dict(data)
+    check_pipeline(pipeline)
+    pipeline = resolve(pipeline, data)
+    groups = []
+    for x, names in group_by_xdata(data):
+        y = np.stack([np.asarray(data[name][1], dtype=float) for name in names])
+        groups.append((np.asarray(x, dtype=float), y, names))
+
+    for step in pipeline:
+        if step[0] == 'resample':
+            _, num_points, low, high = step
+            grid = np.linspace(low, high, int(num_points))
+            y = np.concatenate([resample(x, y, grid) for x, y, _ in groups])
+            groups = [(grid, y, [name for _, _, names in groups for name in names])]
+            continue
+        processed = []
+        for x, y, names in groups:
+            if step[0] == 'despike':
+                y = remove_spikes(y, step[1])
+            elif step[0] == 'smooth':
+                y = smooth(y, step[1], step[2])
+            elif step[0] == 'baseline':
+                y = y - estimate_baseline(x, y, step[1], step[2])
+            elif step[0] == 'normalize':
+                y = normalize(x, y, step[1], step[2])
+            processed.append((x, y, names))
+        groups = processed
+
+    return {name: (x, row) for x, y, names in groups for name, row in zip(names, y)}
+
+
+class PreprocessCache:
+    # 前処理したスペクトルをキャッシュする
+    # {filename: (元のx, 元のy, 解決したパイプライン, 処理したx, 処理したy)}
+    # 元の配列が差し替えられるか（identityで判定），パイプラインかリサンプルの範囲が変わったら作り直す
+    def __init__(self):
+        self.entries = {}
+        self.pipeline = None
+        self.resolved = None
+
+    def is_valid(self, filename: str, x: np.ndarray, y: np.ndarray) -> bool:
+        entry = self.entries.get(filename)
+        return entry is not None and entry[0] is x and entry[1] is y and entry[2] == self.resolved
+
+    def apply_all(self, data: dict, pipeline: tuple) -> None:
+        # data: {filename: (x, y)}．古いものだけまとめて計算する
+        if pipeline is None or len(pipeline) == 0:
+            self.pipeline = pipeline
+            return
+        self.pipeline = pipeline
+        self.resolved = resolve(pipeline, data) if len(data) > 0 else None
+        stale = {filename: xy for filename, xy in data.items() if not self.is_valid(filename, *xy)}
+        self.compute(stale)
+
+    def get(self, filename: str, x: np.ndarray, y: np.ndarray, pipeline: tuple) -> (np.ndarray, np.ndarray):
+        # リサンプルの範囲は全スペクトルで決まるので，先にapply_allでパイプラインを解決しておく
+        # まだ計算されていなければ，そのスペクトルだけ同じ解決済みのパイプラインで計算する
+        if pipeline is None or len(pipeline) == 0:
+            return x, y
+        if pipeline != self.pipeline or self.resolved is None:
+            raise ValueError('apply_all must be called with the pipeline before get.')
+        if not self.is_valid(filename, x, y):
+            self.compute({filename: (x, y)})
+        entry = self.entries[filename]
+        return entry[3], entry[4]
+
+    def compute(self, data: dict) -> None:
+        if len(data) == 0:
+            return
+        results = run_pipeline(data, self.resolved)
+        # 元のxが同じものは，前に計算した分とも処理したxの配列を共有する
+        shared = {id(entry[0]): entry[3] for entry in self.entries.values() if entry[2] == self.resolved}
+        for filename, (x, y) in data.items():
+            x_out, y_out = results[filename]
+            x_out = shared.setdefault(id(x), x_out)
+            self.entries[filename] = (x, y, self.resolved, x_out, y_out)
+
+    def prune(self, filenames) -> None:
+        for filename in [filename for filename in self.entries if filename not in filenames]:
+            del self.entries[filename]
+
+    def clear(self) -> None:
+        self.entries = {}
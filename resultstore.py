@@ -0,0 +1,89 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import numpy as np
+
+# フィッティング結果をSQLiteにまとめて保存する
+# キーはファイルの絶対パスとデータの内容のハッシュなので，同じパスでも中身が変わったものは別の結果になる
+# モデル・範囲・日時で検索できる
+
+DB_PATH = os.path.join(os.path.expanduser('~'), '.pgraph', 'results.sqlite')
+
+
+def content_hash(spec) -> str:
+    # 読み込んだ配列のハッシュ．ファイルを読み直さずに計算できる
+    h = hashlib.sha1()
+    for data in (spec.xdata, spec.ydata):
+        h.update(np.ascontiguousarray(data, dtype=float).tobytes())
+    return h.hexdigest()
+
+
+class ResultStore:
+    def __init__(self, path: str = DB_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        with self.conn:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'path TEXT NOT NULL, content_hash TEXT NOT NULL, function TEXT NOT NULL, '
+                'xmin REAL NOT NULL, xmax REAL NOT NULL, params TEXT NOT NULL, saved_at TEXT NOT NULL, '
+                'PRIMARY KEY (path, content_hash))')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS results_function ON results (function, xmin, xmax)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS results_saved_at ON results (saved_at)')
+
+    def put_many(self, results: dict, function: str, xlim: list) -> int:
+        # results: {filename: (spec, params_fit)}．1回のトランザクションで書き込み，件数を返す
+        saved_at = datetime.datetime.now().isoformat(timespec='seconds')
+        rows = [(os.path.abspath(filename), content_hash(spec), function, float(min(xlim)), float(max(xlim)),
+                 json.dumps([float(value) for value in params_fit]), saved_at)
+                for filename, (spec, params_fit) in results.items()]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+        return len(rows)
+
+    def get(self, filename: str, spec) -> dict:
+        # そのスペクトルの結果．なければNone
+        row = self.conn.execute(
+            'SELECT path, content_hash, function, xmin, xmax, params, saved_at FROM results WHERE path = ? AND content_hash = ?',
+            (os.path.abspath(filename), content_hash(spec))).fetchone()
+        return None if row is None else self.to_dict(row)
+
+    def query(self, function: str = None, xlim: list = None, since: str = None, until: str = None) -> list:
+        # function: モデル名, xlim: この範囲を含むフィッティング範囲のもの, since・until: ISO形式の日時
+        conditions = []
+        args = []
+        if function is not None:
+            conditions.append('function = ?')
+            args.append(function)
+        if xlim is not None:
+            conditions.append('xmin <= ? AND ? <= xmax')
+            args += [float(min(xlim)), float(max(xlim))]
+        if since is not None:
+            conditions.append('saved_at >= ?')
+            args.append(since)
+        if until is not None:
+            conditions.append('saved_at <= ?')
+            args.append(until)
+        sql = 'SELECT path, content_hash, function, xmin, xmax, params, saved_at FROM results'
+        if len(conditions) > 0:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += ' ORDER BY saved_at, path'
+        return [self.to_dict(row) for row in self.conn.execute(sql, args)]
+
+    @staticmethod
+    def to_dict(row: tuple) -> dict:
+        path, digest, function, xmin, xmax, params, saved_at = row
+        return {
+            'path': path,
+            'content_hash': digest,
+            'function': function,
+            'range': [xmin, xmax],
+            'params': json.loads(params),
+            'saved_at': saved_at,
+        }
+
+    def close(self) -> None:
+        self.conn.close()
@@ -0,0 +1,97 @@
+import copy
+import hashlib
+import os
+import pickle
+import threading
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.pgraph', 'cache')
+MAX_BYTES = 1024 ** 3
+
+
+class SpecCache:
+    # 読み込んだスペクトルをバイナリで保存しておき，次回からテキストの解析を省く
+    # キーは絶対パス・更新時刻・サイズなので，ファイルが変更されれば自動的に読み直しになる
+    # 配列は.npyで保存し，メモリマップで読み出す（コピーしない）
+    # 合計サイズがmax_bytesを超えたら，最後に使われたのが古いものから消す
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self.list_files())
+
+    def list_files(self) -> list:
+        return [entry.path for entry in os.scandir(self.directory) if entry.is_file()]
+
+    def get_key(self, filename: str) -> str:
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        return hashlib.sha1(f'{path}|{stat.st_mtime_ns}|{stat.st_size}'.encode()).hexdigest()
+
+    def get(self, filename: str):
+        # キャッシュがあれば(名前, スペクトル)を返す．なければNone
+        try:
+            base = os.path.join(self.directory, self.get_key(filename))
+            with open(base + '.pkl', 'rb') as f:
+                name, spec = pickle.load(f)
+            spec.xdata = np.load(base + '_x.npy', mmap_mode='r')
+            spec.ydata = np.load(base + '_y.npy', mmap_mode='r')
+            os.utime(base + '.pkl')  # LRU用に最終使用時刻を更新
+        except (OSError, EOFError, ValueError, AttributeError, pickle.UnpicklingError):
+            return None
+        return name, spec
+
+    def put(self, filename: str, name: str, spec) -> None:
+        try:
+            base = os.path.join(self.directory, self.get_key(filename))
+        except OSError:
+            return
+        # 配列以外（デバイス名・校正情報など）はpickleで保存する
+        meta = copy.copy(spec)
+        meta.xdata = None
+        meta.ydata = None
+        # 書き込み途中のものを読まないよう，一時ファイルに書いてから置き換える．.pklが最後
+        paths = []
+        for suffix, data in (('_x.npy', spec.xdata), ('_y.npy', spec.ydata), ('.pkl', (name, meta))):
+            tmp = f'{base}{suffix}.{threading.get_ident()}.tmp'
+            with open(tmp, 'wb') as f:
+                if suffix == '.pkl':
+                    pickle.dump(data, f)
+                else:
+                    np.save(f, np.asarray(data))
+            os.replace(tmp, base + suffix)
+            paths.append(base + suffix)
+
+        with self.lock:
+            self.total_bytes += sum(os.path.getsize(path) for path in paths)
+            if self.total_bytes > self.max_bytes:
+                self.evict()
+
+    def evict(self) -> None:
+        # 最後に使われた時刻が古いものから，max_bytesの8割になるまで消す
+        entries = []
+        for path in self.list_files():
+            if path.endswith('.pkl'):
+                base = path[:-len('.pkl')]
+                entries.append((os.path.getmtime(path), base))
+        entries.sort()
+        for _, base in entries:
+            if self.total_bytes <= self.max_bytes * 0.8:
+                break
+            for suffix in ('.pkl', '_x.npy', '_y.npy'):
+                try:
+                    size = os.path.getsize(base + suffix)
+                    os.remove(base + suffix)
+                    self.total_bytes -= size
+                except OSError:  # Windowsではメモリマップ中のファイルは消せない
+                    pass
+
+    def clear(self) -> None:
+        with self.lock:
+            for path in self.list_files():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self.total_bytes = sum(os.path.getsize(path) for path in self.list_files())
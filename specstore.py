@@ -0,0 +1,120 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+
+MIN_SPECTRA = 64
+BLOCK_ROWS = 256
+
+logger = logging.getLogger(__name__)
+
+
+class SpecStore:
+    # マッピング測定のように同じx軸を持つスペクトルが大量にある場合，
+    # ydataを(n_spectra, n_points)の配列にまとめてディスクに置き，メモリマップで読む
+    # 各スペクトルのydataはその行のビューに，xdataは共有の1本に置き換えるので，
+    # 実際に参照された行だけがメモリに読み込まれる
+    # 読み込み中に届いた分から順にまとめるので，全スペクトルが同時にメモリに載ることはない
+    # 書き込み中の配列は埋まるか読み込みが終わったら（finish）読み込み専用で開き直す
+    def __init__(self, directory: str = None, min_spectra: int = MIN_SPECTRA, block_rows: int = BLOCK_ROWS):
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='pgraph_store_')
+        self.directory = directory
+        self.min_spectra = min_spectra
+        self.block_rows = block_rows
+        self.blocks = {}  # {id(block): block}
+        # {x軸のキー: {'x': 共有のx, 'pending': まだまとめていないスペクトル, 'packing': min_spectra本に達したか,
+        #              'block': 書き込み中の配列, 'path': そのファイル, 'rows': [(spec, 書き込んだ行), ...]}}
+        self.groups = {}
+        self.specs = []  # まとめたスペクトル．closeでビューを外すため
+        self.retired = []  # 開き直した後の書き込み用の配列．closeで閉じる
+        self.num_blocks = 0
+
+    def is_packed(self, spec) -> bool:
+        base = getattr(spec.ydata, 'base', None)
+        return base is not None and id(base) in self.blocks and self.blocks[id(base)] is base
+
+    def add(self, spec_dict: dict) -> int:
+        # 新しく読み込んだスペクトルをまとめる．まとめた本数を返す
+        # x軸が共通のスペクトルがmin_spectra本たまるまではそのまま置いておき，それ以降は届いたらすぐディスクに書く
+        num_packed = 0
+        for spec in spec_dict.values():
+            if self.is_packed(spec):
+                continue
+            x = np.asarray(spec.xdata)
+            if x.ndim != 1 or np.shape(spec.ydata) != x.shape:
+                continue
+            key = (x.shape, hashlib.sha1(np.ascontiguousarray(x, dtype=np.float64).tobytes()).hexdigest())
+            group = self.groups.get(key)
+            if group is None:
+                group = {'x': np.array(x, dtype=np.float64), 'pending': [], 'packing': False,
+                         'block': None, 'path': None, 'rows': []}
+                self.groups[key] = group
+            group['pending'].append(spec)
+            if not group['packing'] and len(group['pending']) < self.min_spectra:
+                continue
+            group['packing'] = True
+            for pending in group['pending']:
+                self.write(group, pending)
+            num_packed += len(group['pending'])
+            group['pending'] = []
+        return num_packed
+
+    def write(self, group: dict, spec) -> None:
+        # 書き込み中の配列が埋まったら次の配列を作る（サイズを決めずに読み込みながら追加していくため）
+        if group['block'] is not None and len(group['rows']) == len(group['block']):
+            self.seal(group)
+        if group['block'] is None:
+            path = os.path.join(self.directory, f'block{self.num_blocks}.npy')
+            self.num_blocks += 1
+            block = np.lib.format.open_memmap(path, mode='w+', dtype=np.float64, shape=(self.block_rows, len(group['x'])))
+            self.blocks[id(block)] = block
+            group['block'] = block
+            group['path'] = path
+        row = group['block'][len(group['rows'])]
+        row[:] = spec.ydata
+        group['rows'].append((spec, row))
+        self.specs.append(spec)
+        spec.xdata = group['x']
+        spec.ydata = row
+
+    def seal(self, group: dict) -> None:
+        # 書き込み中の配列をファイルに書き出し，読み込み専用で開き直して各スペクトルの行を差し替える
+        # 書き込み用の配列は，描画などでまだ参照している行がなくなったときに閉じられる
+        block = group['block']
+        block.flush()
+        del self.blocks[id(block)]
+        self.retired.append(block)
+        readonly = np.load(group['path'], mmap_mode='r')
+        self.blocks[id(readonly)] = readonly
+        for i, (spec, row) in enumerate(group['rows']):
+            if spec.ydata is row:
+                spec.ydata = readonly[i]
+        group['block'] = None
+        group['path'] = None
+        group['rows'] = []
+
+    def finish(self) -> None:
+        # 読み込みが終わったら，途中まで書いた配列も読み込み専用にする
+        for group in self.groups.values():
+            if group['block'] is not None:
+                self.seal(group)
+
+    def close(self) -> None:
+        # スペクトルのビューとメモリマップを閉じてからファイルを消す（Windowsでは開いたままのファイルを消せない）
+        # 閉じた後はまとめたスペクトルのydataは使えない
+        for spec in self.specs:
+            if self.is_packed(spec):
+                spec.ydata = None
+        for block in list(self.blocks.values()) + self.retired:
+            block._mmap.close()
+        self.specs = []
+        self.retired = []
+        self.blocks = {}
+        self.groups = {}
+        try:
+            shutil.rmtree(self.directory)
+        except OSError as e:
+            logger.warning('Could not delete the spectrum store %s: %s', self.directory, e)
@@ -0,0 +1,79 @@
+import numpy as np
+
+# 横軸の単位変換
+# 変換したxは元のxの配列ごとにキャッシュし，描画・フィッティングのたびや単位を切り替えるたびに計算し直さない
+
+WAVELENGTH = 'wavelength'  # nm
+ENERGY = 'energy'  # eV
+RAMAN_SHIFT = 'raman'  # cm^-1
+
+
+def get_source_unit(spec) -> str:
+    # 測定データの横軸の単位．Renishawと，Andorで負の値から始まるものはラマンシフト（check_deviceと同じ判定）
+    device = getattr(spec, 'device', None)
+    if device == 'Renishaw' or (device == 'Andor' and spec.xdata[0] < 0):
+        return RAMAN_SHIFT
+    return WAVELENGTH
+
+
+def wavelength_to_energy(x: np.ndarray) -> np.ndarray:
+    return 1240 / x
+
+
+def wavelength_to_raman_shift(x: np.ndarray, laser_wavelength: float) -> np.ndarray:
+    return 1e7 / laser_wavelength - 1e7 / x
+
+
+def raman_shift_to_wavelength(x: np.ndarray, laser_wavelength: float) -> np.ndarray:
+    return 1e7 / (1e7 / laser_wavelength - x)
+
+
+def convert(x: np.ndarray, source: str, unit: str, laser_wavelength: float = None) -> np.ndarray:
+    # 励起波長が分からない場合，波長とラマンシフトは変換できないのでそのまま返す
+    x = np.asarray(x)
+    if source == unit:
+        return x
+    if source == RAMAN_SHIFT:
+        if laser_wavelength is None:
+            return wavelength_to_energy(x) if unit == ENERGY else x
+        x = raman_shift_to_wavelength(x, laser_wavelength)
+        if unit == WAVELENGTH:
+            return x
+    if unit == ENERGY:
+        return wavelength_to_energy(x)
+    elif unit == RAMAN_SHIFT:
+        return x if laser_wavelength is None else wavelength_to_raman_shift(x, laser_wavelength)
+    raise ValueError(f'Unsupported unit: {unit}')
+
+
+class AxisCache:
+    # {(id(xdata), 元の単位): (xdata, {(単位, 励起波長): 変換したx})}
+    # マッピング測定などでxdataの配列を共有するスペクトル（specstore）は，変換したxも1本を共有する
+    # エントリがxdataを参照している間はidが再利用されないので，identityで判定できる
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, spec, unit: str, laser_wavelength: float = None) -> np.ndarray:
+        source = get_source_unit(spec)
+        entry = self.entries.get((id(spec.xdata), source))
+        if entry is None or entry[0] is not spec.xdata:
+            entry = (spec.xdata, {})
+            self.entries[(id(spec.xdata), source)] = entry
+        key = (unit, laser_wavelength)
+        x = entry[1].get(key)
+        if x is None:
+            # 同じ単位で励起波長が違うものは使わなくなるので捨てる
+            for k in [k for k in entry[1] if k[0] == unit]:
+                del entry[1][k]
+            x = convert(spec.xdata, source, unit, laser_wavelength)
+            entry[1][key] = x
+        return x
+
+    def prune(self, spec_dict: dict) -> None:
+        # 読み込まれているスペクトルが参照していないxdataの分を捨てる
+        ids = {id(spec.xdata) for spec in spec_dict.values()}
+        for key in [key for key in self.entries if key[0] not in ids]:
+            del self.entries[key]
+
+    def clear(self) -> None:
+        self.entries = {}